@@ -53,6 +53,42 @@ def init_db():
         print(f"❌ Error al inicializar la base de datos: {e}")
         raise e
 
+def migrate_normativas_halfvec():
+    """Migrar embeddings de normas a halfvec(1536) y asegurar su índice HNSW.
+
+    Las bases creadas antes guardan ``vector(1536)`` y la búsqueda en
+    /consultar-normas compara contra ``%s::halfvec`` (no hay operador vector <=> halfvec).
+    Es idempotente: solo altera la columna si sigue siendo ``vector``.
+    """
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    DO $$
+                    BEGIN
+                        IF EXISTS (
+                            SELECT 1 FROM information_schema.columns
+                            WHERE table_name = 'normativas_embeddings'
+                              AND column_name = 'embedding'
+                              AND udt_name = 'vector'
+                        ) THEN
+                            -- Los índices existentes se reconstruyen con el ALTER
+                            ALTER TABLE normativas_embeddings
+                                ALTER COLUMN embedding TYPE halfvec(1536)
+                                USING embedding::halfvec(1536);
+                        END IF;
+                        IF to_regclass('normativas_embeddings') IS NOT NULL THEN
+                            CREATE INDEX IF NOT EXISTS normativas_embeddings_embedding_idx
+                                ON normativas_embeddings USING hnsw (embedding halfvec_cosine_ops);
+                        END IF;
+                    END $$;
+                """)
+                conn.commit()
+                print("✅ Embeddings de normas verificados (halfvec)")
+    except Exception as e:
+        print(f"❌ Error al migrar embeddings de normas: {e}")
+        raise e
+
 def save_message(user_name: str, user_message: str, bot_response: str):
     """Guardar un mensaje en la base de datos."""
     try:
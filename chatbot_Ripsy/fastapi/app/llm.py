@@ -3,7 +3,7 @@
 # =======================
 import os
 from openai import OpenAI
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 
 # =======================
 # CONFIGURACIÓN DE OPENAI
@@ -28,6 +28,23 @@ MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "2000"))
 TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.7"))
 
+def build_context_messages(message: str, history: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    '''
+    Construye la lista de mensajes para OpenAI a partir del historial y el mensaje actual.
+    '''
+    context_messages = []
+    
+    # Agregar mensajes del historial (últimos 5 para mantener contexto)
+    for msg in history[-5:]:
+        if msg.get("user_message"):
+            context_messages.append({"role": "user", "content": msg["user_message"]})
+        if msg.get("bot_response"):
+            context_messages.append({"role": "assistant", "content": msg["bot_response"]})
+    
+    # Agregar el mensaje actual
+    context_messages.append({"role": "user", "content": message})
+    return context_messages
+
 def generate_reply(user: str, message: str, history: List[Dict[str, Any]]) -> str:
     '''
     Genera una respuesta usando OpenAI GPT basada en el mensaje del usuario y el historial.
@@ -46,17 +63,7 @@ def generate_reply(user: str, message: str, history: List[Dict[str, Any]]) -> st
             return "❌ Error: API Key de OpenAI no configurada. Por favor, configura OPENAI_API_KEY en el archivo .env"
         
         # Construir el contexto del historial
-        context_messages = []
-        
-        # Agregar mensajes del historial (últimos 5 para mantener contexto)
-        for msg in history[-5:]:
-            if msg.get("user_message"):
-                context_messages.append({"role": "user", "content": msg["user_message"]})
-            if msg.get("bot_response"):
-                context_messages.append({"role": "assistant", "content": msg["bot_response"]})
-        
-        # Agregar el mensaje actual
-        context_messages.append({"role": "user", "content": message})
+        context_messages = build_context_messages(message, history)
         
         # Llamar a la API de OpenAI
         openai_client = get_openai_client()
@@ -76,6 +83,44 @@ def generate_reply(user: str, message: str, history: List[Dict[str, Any]]) -> st
     except Exception as e:
         return f"❌ Error con OpenAI: {str(e)}"
 
+def generate_reply_stream(user: str, message: str, history: List[Dict[str, Any]]) -> Iterator[str]:
+    '''
+    Igual que generate_reply, pero entrega la respuesta por fragmentos a medida que OpenAI los genera.
+    
+    Args:
+        user: Nombre del usuario
+        message: Mensaje actual del usuario
+        history: Lista de mensajes anteriores para contexto
+        
+    Yields:
+        str: Fragmentos de texto de la respuesta
+    '''
+    try:
+        if not os.getenv("OPENAI_API_KEY"):
+            yield "❌ Error: API Key de OpenAI no configurada. Por favor, configura OPENAI_API_KEY en el archivo .env"
+            return
+        
+        openai_client = get_openai_client()
+        if not openai_client:
+            yield "❌ Error: Cliente de OpenAI no inicializado. Verifica la configuración de OPENAI_API_KEY."
+            return
+        
+        stream = openai_client.chat.completions.create(
+            model=MODEL,
+            messages=build_context_messages(message, history),
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            user=user,
+            stream=True
+        )
+        
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        
+    except Exception as e:
+        yield f"❌ Error con OpenAI: {str(e)}"
+
 def test_openai_connection() -> Dict[str, Any]:
     '''
     Prueba la conexión con OpenAI para verificar que la API Key funciona.
@@ -6,11 +6,12 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request, File, UploadFile, Form, Query
+from fastapi.responses import StreamingResponse
 
 # Importar funciones de módulos locales
-from db import init_db, fetch_messages, save_message
+from db import init_db, migrate_normativas_halfvec, fetch_messages, save_message
 from storage import read_text_from_minio, upload_file_to_minio, list_files_in_folder
-from llm import generate_reply, test_openai_connection
+from llm import generate_reply, generate_reply_stream, test_openai_connection
 
 # Cargar variables de entorno
 load_dotenv()
@@ -58,9 +59,15 @@ def on_startup():
     """
     Al iniciar FastAPI:
     - Inicializa la base de datos
+    - Migra los embeddings de normas a halfvec (bases creadas con vector)
     - Carga el prompt y el glosario desde MinIO
     """
     init_db()
+    try:
+        migrate_normativas_halfvec()
+    except Exception as e:
+        # Sin pgvector/tabla de normas el resto de la API sigue funcionando
+        print(f"⚠️ /consultar-normas no disponible hasta migrar embeddings: {e}")
     global SYSTEM_PROMPT, GLOSSARY_TEXT
 
     try:
@@ -98,6 +105,31 @@ def chat(payload: dict):
     return {"ok": True, "user": user, "respuesta": reply}
 
 
+@app.post("/chat/stream")
+def chat_stream(payload: dict):
+    """
+    Igual que /chat, pero envía la respuesta por fragmentos (JSON por línea)
+    a medida que el modelo la genera. Guarda el mensaje completo al terminar.
+    """
+    user = payload.get("user", "desconocido")
+    message = payload.get("message", "")
+    if not message:
+        raise HTTPException(status_code=400, detail="Falta 'message' en el payload")
+
+    history = fetch_messages(limit=10)
+
+    def event_stream():
+        partes = []
+        for delta in generate_reply_stream(user, message, history):
+            partes.append(delta)
+            yield json.dumps({"delta": delta}, ensure_ascii=False) + "\n"
+        reply = "".join(partes).strip()
+        save_message(user, message, reply)
+        yield json.dumps({"done": True}) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
 @app.get("/test-openai")
 def test_openai():
     return test_openai_connection()
@@ -180,9 +212,9 @@ async def consultar_normas(request: Request):
     cur = conn.cursor()
     cur.execute("""
         SELECT filename, chunk,
-               1 - (embedding <=> %s::vector) AS similarity
+               1 - (embedding <=> %s::halfvec) AS similarity
         FROM normativas_embeddings
-        ORDER BY embedding <=> %s::vector
+        ORDER BY embedding <=> %s::halfvec
         LIMIT 5;
     """, (emb_vector, emb_vector))
     resultados = cur.fetchall()
@@ -458,10 +490,10 @@ async def generar_rips_endpoint(
             # 3. Construir RIPS
             builder = RipsBuilder(invoice=invoice, patient=patient)
             
-            procedure_records = builder.build_procedure_records()
-            consultation_records = builder.build_consultation_records()
-            medication_records = builder.build_medication_records()
-            other_service_records = builder.build_other_service_records()
+            procedure_records = list(builder.build_procedure_records())
+            consultation_records = list(builder.build_consultation_records())
+            medication_records = list(builder.build_medication_records())
+            other_service_records = list(builder.build_other_service_records())
             invoice_record = builder.build_invoice_record()
             user_record = builder.build_user_record()
             
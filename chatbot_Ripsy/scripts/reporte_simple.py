@@ -4,17 +4,54 @@ Script simplificado para generar reporte de métricas sin emojis
 """
 
 import json
-import matplotlib.pyplot as plt
-import seaborn as sns
-from collections import Counter
-import pandas as pd
+try:
+    import orjson
+    cargar_json = orjson.loads
+except ImportError:  # orjson es opcional; json de la librería estándar como respaldo
+    cargar_json = json.loads
+import argparse
+import hashlib
+import html
+import os
+import shutil
+from pathlib import Path
+import numpy as np
 
-def generar_reporte_simple():
+def tiny_svg_bars(names, values, path, titulo="", color="#87ceeb"):
+    """Escribe un gráfico de barras mínimo en SVG, sin depender de matplotlib"""
+    ancho_barra, separacion, alto, margen = 48, 12, 220, 30
+    ancho = margen * 2 + len(names) * (ancho_barra + separacion)
+    maximo = max(values, default=0) or 1
+    partes = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{ancho}" height="{alto + margen * 2}" font-family="sans-serif" font-size="11">',
+        f'<text x="{margen}" y="18" font-size="13" font-weight="bold">{html.escape(titulo)}</text>',
+    ]
+    for i, (nombre, valor) in enumerate(zip(names, values)):
+        h = valor / maximo * (alto - margen)
+        x = margen + i * (ancho_barra + separacion)
+        y = margen + (alto - margen) - h
+        partes.append(f'<rect x="{x}" y="{y:.1f}" width="{ancho_barra}" height="{h:.1f}" fill="{color}"/>')
+        partes.append(f'<text x="{x + ancho_barra / 2}" y="{y - 3:.1f}" text-anchor="middle">{valor}</text>')
+        partes.append(f'<text x="{x + ancho_barra / 2}" y="{alto + margen - 12}" text-anchor="middle">{html.escape(str(nombre))}</text>')
+    partes.append('</svg>')
+    Path(path).write_text("".join(partes), encoding="utf-8")
+
+def generar_reporte_simple(graficar=False, fancy=False):
     """Genera reporte simple de las métricas"""
     
-    # Cargar análisis
-    with open("analisis_dataset.json", "r", encoding="utf-8") as f:
-        datos = json.load(f)
+    # Cargar análisis (el hash del contenido identifica el gráfico ya generado)
+    with open("analisis_dataset.json", "rb") as f:
+        contenido = f.read()
+    datos = cargar_json(contenido)
+    grafico_cache = Path(f".metricas_simple_{hashlib.md5(contenido).hexdigest()}.png")
+    
+    # Agregados calculados una sola vez y reutilizados en todo el reporte
+    codigos = datos['codigos_validacion']
+    conteos = np.fromiter(codigos.values(), dtype=np.int64, count=len(codigos))
+    total = int(conteos.sum())
+    i_max = int(conteos.argmax())
+    codigo_top = list(codigos)[i_max]
+    valor_top = int(conteos[i_max])
     
     print("\n" + "="*60)
     print("REPORTE DETALLADO DE METRICAS DEL DATASET")
@@ -22,11 +59,11 @@ def generar_reporte_simple():
     
     print(f"\nDATOS GENERALES:")
     print(f"   • Archivos procesados: {datos['resumen']['archivos_procesados']}")
-    print(f"   • Total validaciones: {sum(datos['codigos_validacion'].values())}")
+    print(f"   • Total validaciones: {total}")
     print(f"   • Errores encontrados: {datos['resumen']['errores_encontrados']}")
     
     print(f"\nTOP 5 CODIGOS MAS PROBLEMATICOS:")
-    codigos_ordenados = sorted(datos['codigos_validacion'].items(), key=lambda x: x[1], reverse=True)
+    codigos_ordenados = sorted(codigos.items(), key=lambda x: x[1], reverse=True)
     for i, (codigo, count) in enumerate(codigos_ordenados[:5], 1):
         print(f"   {i}. {codigo}: {count} ocurrencias")
     
@@ -44,8 +81,8 @@ def generar_reporte_simple():
     bajo_riesgo = 0
     
     for codigo, (descripcion, riesgo) in codigos_riesgo.items():
-        if codigo in datos['codigos_validacion']:
-            count = datos['codigos_validacion'][codigo]
+        if codigo in codigos:
+            count = codigos[codigo]
             print(f"   • {codigo} ({descripcion}): {count} veces - RIESGO {riesgo}")
             
             if riesgo == 'ALTO':
@@ -55,8 +92,6 @@ def generar_reporte_simple():
             else:
                 bajo_riesgo += count
     
-    total = sum(datos['codigos_validacion'].values())
-    
     print(f"\nDISTRIBUCION DE RIESGO:")
     print(f"   • ALTO RIESGO: {alto_riesgo} validaciones ({alto_riesgo/total*100:.1f}%)")
     print(f"   • MEDIO RIESGO: {medio_riesgo} validaciones ({medio_riesgo/total*100:.1f}%)")
@@ -74,59 +109,77 @@ def generar_reporte_simple():
     print(f"   • Codigos de alto riesgo: {alto_riesgo}/{total} ({(alto_riesgo/total)*100:.1f}%)")
     print(f"   • Datos suficientes para entrenamiento: {'SI' if datos['resumen']['archivos_procesados'] >= 10 else 'NO'}")
     
-    # Crear gráfico simple
-    try:
-        plt.figure(figsize=(12, 8))
+    # Crear gráfico simple en SVG (solo con --plot)
+    if graficar:
+        codigos_top = codigos_ordenados[:8]
+        tiny_svg_bars([c for c, _ in codigos_top], [v for _, v in codigos_top],
+                      'metricas_codigos.svg', 'Codigos de Validacion Mas Frecuentes')
+        tiny_svg_bars(['ALTO', 'MEDIO', 'BAJO'], [alto_riesgo, medio_riesgo, bajo_riesgo],
+                      'metricas_riesgo.svg', 'Distribucion por Nivel de Riesgo', color='#ffa500')
+        print(f"\nGraficos guardados como: metricas_codigos.svg, metricas_riesgo.svg")
+    
+    # Gráfico completo con matplotlib (solo con --fancy; se omite si el análisis no cambió)
+    if fancy and grafico_cache.exists():
+        shutil.copyfile(grafico_cache, 'metricas_dataset.png')
+        print(f"\nAnalisis sin cambios, grafico reutilizado: metricas_dataset.png")
+    elif fancy:
+        try:
+            # El reporte solo guarda el gráfico, no lo muestra
+            os.environ.setdefault("MPLBACKEND", "Agg")
+            import matplotlib.pyplot as plt
+            
+            plt.figure(figsize=(12, 8))
         
-        # Gráfico 1: Códigos más frecuentes
-        plt.subplot(2, 2, 1)
-        codigos_top = dict(codigos_ordenados[:8])
-        plt.bar(codigos_top.keys(), codigos_top.values(), color='skyblue')
-        plt.title('Codigos de Validacion Mas Frecuentes')
-        plt.xlabel('Codigo')
-        plt.ylabel('Frecuencia')
-        plt.xticks(rotation=45)
+            # Gráfico 1: Códigos más frecuentes
+            plt.subplot(2, 2, 1)
+            codigos_top = dict(codigos_ordenados[:8])
+            plt.bar(codigos_top.keys(), codigos_top.values(), color='skyblue')
+            plt.title('Codigos de Validacion Mas Frecuentes')
+            plt.xlabel('Codigo')
+            plt.ylabel('Frecuencia')
+            plt.xticks(rotation=45)
         
-        # Gráfico 2: Distribución de riesgo
-        plt.subplot(2, 2, 2)
-        niveles = ['ALTO', 'MEDIO', 'BAJO']
-        valores = [alto_riesgo, medio_riesgo, bajo_riesgo]
-        colores = ['red', 'orange', 'green']
-        plt.bar(niveles, valores, color=colores, alpha=0.7)
-        plt.title('Distribucion por Nivel de Riesgo')
-        plt.xlabel('Nivel de Riesgo')
-        plt.ylabel('Cantidad')
+            # Gráfico 2: Distribución de riesgo
+            plt.subplot(2, 2, 2)
+            niveles = ['ALTO', 'MEDIO', 'BAJO']
+            valores = [alto_riesgo, medio_riesgo, bajo_riesgo]
+            colores = ['red', 'orange', 'green']
+            plt.bar(niveles, valores, color=colores, alpha=0.7)
+            plt.title('Distribucion por Nivel de Riesgo')
+            plt.xlabel('Nivel de Riesgo')
+            plt.ylabel('Cantidad')
         
-        # Gráfico 3: Porcentajes
-        plt.subplot(2, 2, 3)
-        porcentajes = [alto_riesgo/total*100, medio_riesgo/total*100, bajo_riesgo/total*100]
-        plt.pie(porcentajes, labels=niveles, autopct='%1.1f%%', colors=colores)
-        plt.title('Distribucion Porcentual de Riesgo')
+            # Gráfico 3: Porcentajes
+            plt.subplot(2, 2, 3)
+            porcentajes = [alto_riesgo/total*100, medio_riesgo/total*100, bajo_riesgo/total*100]
+            plt.pie(porcentajes, labels=niveles, autopct='%1.1f%%', colors=colores)
+            plt.title('Distribucion Porcentual de Riesgo')
         
-        # Gráfico 4: Resumen
-        plt.subplot(2, 2, 4)
-        plt.axis('off')
-        resumen_texto = f"""RESUMEN ESTADISTICO
+            # Gráfico 4: Resumen
+            plt.subplot(2, 2, 4)
+            plt.axis('off')
+            resumen_texto = f"""RESUMEN ESTADISTICO
         
 Archivos: {datos['resumen']['archivos_procesados']}
 Validaciones: {total}
 Errores: {datos['resumen']['errores_encontrados']}
 
 Codigo mas frecuente:
-{max(datos['codigos_validacion'].items(), key=lambda x: x[1])[0]}: {max(datos['codigos_validacion'].values())} veces
+{codigo_top}: {valor_top} veces
 
 Probabilidad base glosa: {(alto_riesgo/total)*100:.1f}%
 Datos suficientes: {'SI' if datos['resumen']['archivos_procesados'] >= 10 else 'NO'}"""
         
-        plt.text(0.1, 0.5, resumen_texto, fontsize=10, verticalalignment='center',
-                bbox=dict(boxstyle="round,pad=0.5", facecolor="lightblue", alpha=0.8))
+            plt.text(0.1, 0.5, resumen_texto, fontsize=10, verticalalignment='center',
+                    bbox=dict(boxstyle="round,pad=0.5", facecolor="lightblue", alpha=0.8))
         
-        plt.tight_layout()
-        plt.savefig('metricas_dataset.png', dpi=300, bbox_inches='tight')
-        print(f"\nGrafico guardado como: metricas_dataset.png")
+            plt.tight_layout()
+            plt.savefig(grafico_cache, dpi=150, bbox_inches='tight')
+            shutil.copyfile(grafico_cache, 'metricas_dataset.png')
+            print(f"\nGrafico guardado como: metricas_dataset.png")
         
-    except Exception as e:
-        print(f"Error creando grafico: {e}")
+        except Exception as e:
+            print(f"Error creando grafico: {e}")
     
     print("\n" + "="*60)
     
@@ -139,8 +192,13 @@ Datos suficientes: {'SI' if datos['resumen']['archivos_procesados'] >= 10 else '
     }
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reporte simple de metricas del dataset")
+    parser.add_argument("--plot", action="store_true", help="Generar graficos SVG de barras (sin matplotlib)")
+    parser.add_argument("--fancy", action="store_true", help="Generar metricas_dataset.png con matplotlib")
+    args = parser.parse_args()
+    
     try:
-        metricas = generar_reporte_simple()
+        metricas = generar_reporte_simple(graficar=args.plot, fancy=args.fancy)
         print("\nReporte de metricas generado exitosamente!")
         
     except Exception as e:
@@ -2,16 +2,19 @@
 # -*- coding: utf-8 -*-
 
 import os
-import openai
-import psycopg2
-from psycopg2.extras import execute_values
+import asyncio
+import hashlib
+import numpy as np
+from psycopg2.extras import execute_batch
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
+from openai import AsyncOpenAI
 from pathlib import Path
-from PyPDF2 import PdfReader
+import pypdfium2 as pdfium
 
 # === CONFIGURACIÓN ===
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 DB_PARAMS = {
     "host": os.getenv("POSTGRES_HOST"),
@@ -21,41 +24,73 @@ DB_PARAMS = {
     "password": os.getenv("POSTGRES_PASSWORD"),
 }
 
+# Conexiones reutilizables: evita abrir TCP + autenticación en cada guardado
+POOL = ThreadedConnectionPool(1, 8, **DB_PARAMS)
+
 DIRECTORIO = Path("data")
+TAMANO_LOTE = 64        # fragmentos por petición de embeddings
+MAX_CONCURRENCIA = 16   # peticiones simultáneas hacia la API
 
 # === FUNCIONES ===
 
 def extraer_texto_pdf(ruta):
-    reader = PdfReader(ruta)
-    texto = ""
-    for page in reader.pages:
-        texto += page.extract_text() or ""
-    return texto.strip()
+    pdf = pdfium.PdfDocument(ruta)
+    try:
+        partes = [pdf[i].get_textpage().get_text_range() for i in range(len(pdf))]
+    finally:
+        pdf.close()
+    return "".join(partes).strip()
 
-def obtener_embeddings(texto):
-    response = openai.embeddings.create(
-        model="text-embedding-3-small",
-        input=texto
-    )
-    return response.data[0].embedding
+async def embeber_lote(client, semaforo, textos):
+    async with semaforo:
+        response = await client.embeddings.create(
+            model="text-embedding-3-small",
+            input=textos
+        )
+    return [d.embedding for d in response.data]
+
+async def obtener_embeddings(textos):
+    # El cliente reintenta con backoff exponencial ante errores de red o rate limit
+    client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=5)
+    semaforo = asyncio.Semaphore(MAX_CONCURRENCIA)
+    lotes = [textos[i:i + TAMANO_LOTE] for i in range(0, len(textos), TAMANO_LOTE)]
+    resultados = await asyncio.gather(*(embeber_lote(client, semaforo, lote) for lote in lotes))
+    return [embedding for lote in resultados for embedding in lote]
 
 def guardar_embeddings(docs):
-    conn = psycopg2.connect(**DB_PARAMS)
+    conn = POOL.getconn()
+    try:
+        _insertar_embeddings(conn, docs)
+    finally:
+        POOL.putconn(conn)
+
+def _insertar_embeddings(conn, docs):
     cur = conn.cursor()
     cur.execute("""
         CREATE TABLE IF NOT EXISTS normativas_embeddings (
             id SERIAL PRIMARY KEY,
             filename TEXT,
             chunk TEXT,
-            embedding vector(1536)
+            embedding halfvec(1536)
         );
     """)
-    execute_values(cur,
-        "INSERT INTO normativas_embeddings (filename, chunk, embedding) VALUES %s",
-        [(d['filename'], d['chunk'], d['embedding']) for d in docs]
+    # Carga masiva: sin esperar el flush del WAL (SET LOCAL se revierte al hacer commit)
+    cur.execute("SET LOCAL synchronous_commit TO OFF")
+    # La sentencia preparada vive en la sesión: se prepara una vez por conexión del pool
+    cur.execute("SELECT 1 FROM pg_prepared_statements WHERE name = 'ins_embed'")
+    if cur.fetchone() is None:
+        cur.execute("""
+            PREPARE ins_embed (text, text, halfvec) AS
+            INSERT INTO normativas_embeddings (filename, chunk, embedding) VALUES ($1, $2, $3)
+        """)
+    execute_batch(cur,
+        "EXECUTE ins_embed (%s, %s, %s)",
+        # halfvec: media precisión, la mitad de espacio por fila frente a vector (float32)
+        [(d['filename'], d['chunk'], np.asarray(d['embedding'], dtype=np.float16).tolist()) for d in docs],
+        page_size=500
     )
     conn.commit()
-    conn.close()
+    cur.close()
 
 def dividir_texto(texto, n=800):
     palabras = texto.split()
@@ -63,16 +98,21 @@ def dividir_texto(texto, n=800):
         yield " ".join(palabras[i:i+n])
 
 # === PROCESO ===
-docs = []
+# Encabezados, pies de página e índices se repiten entre normas: cada texto único se embebe una vez
+fragmentos = []
+unicos = {}
 for archivo in DIRECTORIO.glob("*.pdf"):
     texto = extraer_texto_pdf(archivo)
     for chunk in dividir_texto(texto):
-        embedding = obtener_embeddings(chunk)
-        docs.append({
-            "filename": archivo.name,
-            "chunk": chunk,
-            "embedding": embedding
-        })
+        h = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        unicos.setdefault(h, chunk)
+        fragmentos.append((archivo.name, chunk, h))
+
+vectores = dict(zip(unicos, asyncio.run(obtener_embeddings(list(unicos.values())))))
+docs = [
+    {"filename": filename, "chunk": chunk, "embedding": vectores[h]}
+    for filename, chunk, h in fragmentos
+]
 
 guardar_embeddings(docs)
-print(f"✅ Vectorización completa. Se guardaron {len(docs)} fragmentos en la BD.")
+print(f"✅ Vectorización completa. Se guardaron {len(docs)} fragmentos en la BD ({len(unicos)} embeddings únicos).")
@@ -1,9 +1,19 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from requests_toolbelt import MultipartEncoder
 import json
+import hashlib
+import html
+import os
+import shutil
+import tempfile
 import time
 from datetime import datetime
 import base64
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 
 # ======================================================
@@ -126,87 +136,255 @@ st.markdown("""
 # 🔧 CONFIGURACIÓN DE API
 # ======================================================
 API_BASE_URL = "http://localhost:8200"
+CHAT_WINDOW = 50  # mensajes del chat que se renderizan por rerun
+RENDER_CACHE_MAX = 500  # fragmentos HTML de mensajes memorizados por sesión
+STREAM_FLUSH_SECONDS = 0.05  # intervalo mínimo entre actualizaciones de la respuesta en streaming
+STREAM_FLUSH_CHARS = 128      # o antes, si se acumulan estos caracteres
 
+@st.cache_resource
+def api_session():
+    """Sesión HTTP compartida entre reruns y pestañas: reutiliza conexiones keep-alive hacia la API"""
+    session = requests.Session()
+    session.headers.update({"Connection": "keep-alive"})
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=Retry(total=2, backoff_factor=0.1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_data(ttl=15, show_spinner=False)
 def test_api_connection():
     """Prueba la conexión con la API"""
     try:
-        response = requests.get(f"{API_BASE_URL}/", timeout=5)
+        response = api_session().get(f"{API_BASE_URL}/", timeout=5)
         return response.status_code == 200
     except:
         return False
 
-def send_chat_message(user, message):
-    """Envía mensaje al chatbot"""
+def send_chat_message_stream(user, message):
+    """Envía mensaje al chatbot y entrega la respuesta por fragmentos (JSON por línea)"""
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/chat",
+        with api_session().post(
+            f"{API_BASE_URL}/chat/stream",
             json={"user": user, "message": message},
+            stream=True,
             timeout=30
-        )
-        return response.json() if response.status_code == 200 else None
+        ) as response:
+            if response.status_code != 200:
+                return
+            for line in response.iter_lines():
+                if line:
+                    chunk = json.loads(line)
+                    if "delta" in chunk:
+                        yield chunk["delta"]
     except:
-        return None
+        return
 
+@st.cache_data(ttl=15, show_spinner=False)
 def get_openai_status():
     """Obtiene el estado de OpenAI"""
     try:
-        response = requests.get(f"{API_BASE_URL}/test-openai", timeout=10)
+        response = api_session().get(f"{API_BASE_URL}/test-openai", timeout=10)
         return response.json() if response.status_code == 200 else None
     except:
         return None
 
-def analizar_glosa(factura_file, historia_file):
+def build_pdf_multipart(factura_file, historia_file):
+    """Arma el cuerpo multipart que se envía por partes desde los archivos subidos"""
+    return MultipartEncoder(fields={
+        'factura': ('factura.pdf', factura_file, 'application/pdf'),
+        'historia_clinica': ('historia.pdf', historia_file, 'application/pdf')
+    })
+
+@contextmanager
+def spooled_pdf(uploaded_file):
+    """Copia el PDF subido a un archivo temporal y entrega su ruta; lo borra al salir"""
+    uploaded_file.seek(0)
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+    try:
+        with tmp:
+            shutil.copyfileobj(uploaded_file, tmp)
+        yield tmp.name
+    finally:
+        os.remove(tmp.name)
+
+def analizar_glosa(factura_path, historia_path):
     """Envía archivos para análisis de glosa"""
     try:
-        files = {
-            'factura': ('factura.pdf', factura_file, 'application/pdf'),
-            'historia_clinica': ('historia.pdf', historia_file, 'application/pdf')
-        }
-        
-        response = requests.post(
-            f"{API_BASE_URL}/analizar-glosa",
-            files=files,
-            timeout=60
-        )
+        with open(factura_path, "rb") as factura_file, open(historia_path, "rb") as historia_file:
+            body = build_pdf_multipart(factura_file, historia_file)
+            
+            response = api_session().post(
+                f"{API_BASE_URL}/analizar-glosa",
+                data=body,
+                headers={"Content-Type": body.content_type},
+                timeout=60
+            )
         return response.json() if response.status_code == 200 else None
     except:
         return None
 
-def generar_rips(factura_file, historia_file):
+def generar_rips(factura_path, historia_path):
     """Envía archivos para generar RIPS"""
     try:
-        files = {
-            'factura': ('factura.pdf', factura_file, 'application/pdf'),
-            'historia_clinica': ('historia.pdf', historia_file, 'application/pdf')
-        }
-        
-        response = requests.post(
-            f"{API_BASE_URL}/generar-rips",
-            files=files,
-            timeout=120
-        )
+        with open(factura_path, "rb") as factura_file, open(historia_path, "rb") as historia_file:
+            body = build_pdf_multipart(factura_file, historia_file)
+            
+            response = api_session().post(
+                f"{API_BASE_URL}/generar-rips",
+                data=body,
+                headers={"Content-Type": body.content_type},
+                timeout=120
+            )
         return response.json() if response.status_code == 200 else None
     except:
         return None
 
+def message_html(message, animate=False):
+    """Arma el HTML de un mensaje del chat con el contenido escapado; solo el más reciente se anima"""
+    contenido = html.escape(message["content"]).replace("\n", "<br>")
+    fade = " fade-in" if animate else ""
+    if message["role"] == "user":
+        return (f'<div class="user-message{fade}"><strong>👤 {html.escape(message["user"])}:</strong><br>'
+                f'{contenido}</div>')
+    return f'<div class="bot-message{fade}"><strong>💙 Ripsy:</strong><br>{contenido}</div>'
+
+def add_message(**message):
+    """Agrega un mensaje al historial con id incremental y hash de contenido"""
+    message_id = st.session_state.get("next_message_id", 0)
+    st.session_state.next_message_id = message_id + 1
+    message["id"] = message_id
+    message["content_hash"] = hash((message.get("user"), message["content"]))
+    st.session_state.messages.append(message)
+    return message
+
+def cached_message_html(message, animate=False):
+    """HTML del mensaje memorizado por (id, hash) en una LRU acotada de la sesión"""
+    cache = st.session_state.setdefault("render_cache", OrderedDict())
+    key = (message.get("id"), message.get("content_hash"), animate)
+    if key[0] is None:
+        return message_html(message, animate)
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    rendered = cache[key] = message_html(message, animate)
+    if len(cache) > RENDER_CACHE_MAX:
+        cache.popitem(last=False)
+    return rendered
+
+def rips_file_bytes(contenido):
+    """Contenido de un archivo plano RIPS en bytes; las listas se unen con saltos de línea"""
+    if isinstance(contenido, list):
+        contenido = "\n".join(contenido)
+    return contenido.encode("utf-8")
+
+class ApiError(Exception):
+    """La API no devolvió un resultado válido (no se guarda en caché)"""
+
+def pdf_pair_key(factura_file, historia_file):
+    """Clave estable del par de PDFs subidos según su contenido"""
+    return (hashlib.sha256(factura_file.getbuffer()).hexdigest()
+            + hashlib.sha256(historia_file.getbuffer()).hexdigest())
+
+@st.cache_data(ttl=3600, max_entries=50, show_spinner=False)
+def analizar_glosa_cached(key, _factura_file, _historia_file):
+    """Análisis de glosa memorizado por contenido; los archivos solo se envían si no hay resultado"""
+    with spooled_pdf(_factura_file) as factura_path, spooled_pdf(_historia_file) as historia_path:
+        resultado = analizar_glosa(factura_path, historia_path)
+    if not (resultado and resultado.get("ok")):
+        raise ApiError("analizar-glosa")
+    return resultado
+
+@st.cache_data(ttl=3600, max_entries=50, show_spinner=False)
+def generar_rips_cached(key, _factura_file, _historia_file):
+    """Generación de RIPS memorizada por contenido; los archivos solo se envían si no hay resultado"""
+    with spooled_pdf(_factura_file) as factura_path, spooled_pdf(_historia_file) as historia_path:
+        resultado = generar_rips(factura_path, historia_path)
+    if not (resultado and resultado.get("ok")):
+        raise ApiError("generar-rips")
+    return resultado
+
 # ======================================================
-# 🎨 INTERFAZ PRINCIPAL
+# 🧱 CONTENIDO ESTÁTICO
 # ======================================================
 
-# Header principal
-st.markdown("""
+HEADER_HTML = """
 <div class="main-header fade-in">
     <h1>💙 Ripsy - Chatbot de Auditoría en Salud</h1>
     <p style="font-size: 1.2rem; margin: 0;">Tu asistente inteligente para facturación y normatividad en salud</p>
 </div>
-""", unsafe_allow_html=True)
+"""
+
+FOOTER_HTML = """
+<div style="text-align: center; color: #666; padding: 2rem;">
+    <p>💙 <strong>Ripsy</strong> - Desarrollado con amor para la Red de Salud del Oriente E.S.E.</p>
+    <p>Powered by FastAPI + OpenAI + Streamlit</p>
+</div>
+"""
+
+FEATURES_DATA = [
+    {
+        "icon": "🧠",
+        "title": "IA Avanzada",
+        "description": "Powered by OpenAI GPT-4o-mini"
+    },
+    {
+        "icon": "🏥",
+        "title": "RIPS Expert",
+        "description": "Especialista en registros de salud"
+    },
+    {
+        "icon": "🔬",
+        "title": "Auditoría",
+        "description": "Análisis inteligente de facturas"
+    },
+    {
+        "icon": "📜",
+        "title": "Normativas",
+        "description": "Conocimiento de normativa colombiana"
+    },
+    {
+        "icon": "✅",
+        "title": "Validación",
+        "description": "Verificación automática de datos"
+    },
+    {
+        "icon": "👩‍⚕️",
+        "title": "Asesoría",
+        "description": "Orientación en procesos de salud"
+    }
+]
+
+@st.cache_data(show_spinner=False)
+def _features_html():
+    """Tarjetas de características en 2 columnas (CSS flexbox) como un único bloque HTML"""
+    def columna(features):
+        cards = "".join(
+            f'<div class="feature-card fade-in"><h4>{f["icon"]} {f["title"]}</h4><p>{f["description"]}</p></div>'
+            for f in features
+        )
+        return f'<div style="flex: 1;">{cards}</div>'
+    
+    return (
+        '<div style="display: flex; gap: 1rem; margin: 1rem 0;">'
+        + columna(FEATURES_DATA[:3])  # Primeras 3
+        + columna(FEATURES_DATA[3:])  # Últimas 3
+        + '</div>'
+    )
+
+# ======================================================
+# 🎨 INTERFAZ PRINCIPAL
+# ======================================================
+
+# Header principal
+st.markdown(HEADER_HTML, unsafe_allow_html=True)
 
 # Sidebar con información del sistema
 with st.sidebar:
     st.markdown("### 🔧 Estado del Sistema")
     
-    # Verificar conexión API
-    if test_api_connection():
+    # Verificar conexión API (una sola vez por rerun; el resto de la app lee api_ok)
+    st.session_state["api_ok"] = test_api_connection()
+    if st.session_state["api_ok"]:
         st.markdown("""
         <div class="status-card">
             <h4>✅ API Conectada</h4>
@@ -247,218 +425,150 @@ with st.sidebar:
     
     st.markdown("### 🛠️ Herramientas")
     if st.button("🔄 Recargar Configuración"):
-        st.success("Configuración recargada!")
+        test_api_connection.clear()
+        get_openai_status.clear()
+        st.toast("Configuración recargada!")
+        st.rerun()
     
     if st.button("📋 Ver Historial"):
         st.info("Función próximamente disponible")
 
-# Tabs para diferentes funcionalidades
-tab1, tab2, tab3 = st.tabs(["💬 Chat con Ripsy", "🔍 Análisis de Glosa", "📂 Generar RIPS"])
-
-with tab1:
+# Cada pestaña es un fragmento: sus widgets solo re-ejecutan su propia pestaña
+@st.fragment
+def render_chat_tab():
+    """Pestaña de chat con Ripsy"""
     # Contenido principal del chat
     col1, col2 = st.columns([2, 1])
 
-with col1:
-    st.markdown("### 💬 Chat con Ripsy")
-    
-    # Inicializar session state
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-    
-    if "user_name" not in st.session_state:
-        st.session_state.user_name = "Usuario"
-    
-    # Input para nombre de usuario
-    user_name = st.text_input("👤 Tu nombre:", value=st.session_state.user_name, key="user_input")
-    st.session_state.user_name = user_name
-    
-    # Contenedor de mensajes
-    chat_container = st.container()
-    
-    # Mostrar mensajes existentes
-    with chat_container:
-        for message in st.session_state.messages:
-            if message["role"] == "user":
-                st.markdown(f"""
-                <div class="user-message fade-in">
-                    <strong>👤 {message['user']}:</strong><br>
-                    {message['content']}
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div class="bot-message fade-in">
-                    <strong>💙 Ripsy:</strong><br>
-                    {message['content']}
-                </div>
-                """, unsafe_allow_html=True)
-    
-    # Input para nuevo mensaje
-    with st.form("chat_form", clear_on_submit=True):
-        user_input = st.text_area(
-            "💬 Escribe tu pregunta sobre facturación en salud:",
-            placeholder="Ejemplo: ¿Cómo funciona la auditoría de facturas?",
-            height=100
-        )
+    with col1:
+        st.markdown("### 💬 Chat con Ripsy")
+    
+        # Inicializar session state
+        if "messages" not in st.session_state:
+            st.session_state.messages = []
+    
+        if "user_name" not in st.session_state:
+            st.session_state.user_name = "Usuario"
+    
+        # Input para nombre de usuario
+        user_name = st.text_input("👤 Tu nombre:", value=st.session_state.user_name, key="user_input")
+        st.session_state.user_name = user_name
+    
+        # Ventana de mensajes visibles: solo se renderizan los últimos N
+        st.session_state.setdefault("visible_count", CHAT_WINDOW)
+        if len(st.session_state.messages) > st.session_state.visible_count:
+            st.button(
+                f"⬆️ Cargar {CHAT_WINDOW} anteriores",
+                on_click=lambda: st.session_state.update(visible_count=st.session_state.visible_count + CHAT_WINDOW)
+            )
+    
+        # Contenedor de mensajes
+        chat_container = st.container()
+    
+        # Mostrar mensajes existentes en un único bloque HTML
+        with chat_container:
+            visibles = st.session_state.messages[-st.session_state.visible_count:]
+            if visibles:
+                ultimo = len(visibles) - 1
+                st.markdown(
+                    "".join(cached_message_html(m, animate=(i == ultimo)) for i, m in enumerate(visibles)),
+                    unsafe_allow_html=True
+                )
+    
+        # Input para nuevo mensaje
+        with st.form("chat_form", clear_on_submit=True):
+            user_input = st.text_area(
+                "💬 Escribe tu pregunta sobre facturación en salud:",
+                placeholder="Ejemplo: ¿Cómo funciona la auditoría de facturas?",
+                height=100
+            )
         
-        col1, col2, col3 = st.columns([1, 1, 1])
-        with col1:
-            send_button = st.form_submit_button("🚀 Enviar", use_container_width=True)
-        with col2:
-            clear_button = st.form_submit_button("🗑️ Limpiar", use_container_width=True)
-        with col3:
-            test_button = st.form_submit_button("🧪 Probar OpenAI", use_container_width=True)
-    
-    # Procesar botones
-    if clear_button:
-        st.session_state.messages = []
-        st.rerun()
+            col1, col2, col3 = st.columns([1, 1, 1])
+            with col1:
+                send_button = st.form_submit_button("🚀 Enviar", use_container_width=True)
+            with col2:
+                clear_button = st.form_submit_button("🗑️ Limpiar", use_container_width=True)
+            with col3:
+                test_button = st.form_submit_button("🧪 Probar OpenAI", use_container_width=True)
+    
+        # Procesar botones
+        if clear_button:
+            st.session_state.messages = []
+            st.session_state.render_cache = OrderedDict()
+            st.session_state.visible_count = CHAT_WINDOW
+            st.rerun(scope="fragment")
+    
+        if test_button:
+            with st.spinner("🧪 Probando conexión con OpenAI..."):
+                openai_status = get_openai_status()
+                if openai_status and openai_status.get("success"):
+                    st.success(f"✅ OpenAI funcionando! Respuesta: {openai_status.get('response', 'N/A')}")
+                else:
+                    st.error("❌ Error conectando con OpenAI")
     
-    if test_button:
-        with st.spinner("🧪 Probando conexión con OpenAI..."):
-            openai_status = get_openai_status()
-            if openai_status and openai_status.get("success"):
-                st.success(f"✅ OpenAI funcionando! Respuesta: {openai_status.get('response', 'N/A')}")
+        if send_button and user_input:
+            if not st.session_state.get("api_ok"):
+                st.error("❌ No se puede conectar con la API. Verifica que FastAPI esté corriendo en el puerto 8200.")
             else:
-                st.error("❌ Error conectando con OpenAI")
-    
-    if send_button and user_input:
-        if not test_api_connection():
-            st.error("❌ No se puede conectar con la API. Verifica que FastAPI esté corriendo en el puerto 8200.")
-        else:
-            # Agregar mensaje del usuario
-            st.session_state.messages.append({
-                "role": "user",
-                "user": user_name,
-                "content": user_input
-            })
+                # Agregar mensaje del usuario
+                add_message(role="user", user=user_name, content=user_input)
             
-            # Mostrar mensaje del usuario inmediatamente
-            with chat_container:
-                st.markdown(f"""
-                <div class="user-message fade-in">
-                    <strong>👤 {user_name}:</strong><br>
-                    {user_input}
-                </div>
-                """, unsafe_allow_html=True)
+                # Mostrar mensaje del usuario inmediatamente
+                with chat_container:
+                    st.markdown(cached_message_html(st.session_state.messages[-1], animate=True), unsafe_allow_html=True)
             
-            # Obtener respuesta del bot
-            with st.spinner("💙 Ripsy está pensando..."):
-                response = send_chat_message(user_name, user_input)
-                
-                if response and response.get("ok"):
-                    bot_response = response.get("respuesta", "Lo siento, no pude procesar tu mensaje.")
-                    
+                # Obtener respuesta del bot y mostrarla a medida que llega
+                with chat_container:
+                    placeholder = st.empty()
+                placeholder.caption("💙 Ripsy está pensando...")
+                # Los tokens se acumulan y el placeholder se actualiza cada ~50 ms o 128 caracteres
+                bot_response = ""
+                pendiente = 0
+                last_flush = time.monotonic()
+                for chunk in send_chat_message_stream(user_name, user_input):
+                    bot_response += chunk
+                    pendiente += len(chunk)
+                    now = time.monotonic()
+                    if now - last_flush > STREAM_FLUSH_SECONDS or pendiente > STREAM_FLUSH_CHARS:
+                        placeholder.markdown(message_html({"role": "assistant", "content": bot_response}), unsafe_allow_html=True)
+                        pendiente = 0
+                        last_flush = now
+            
+                if bot_response.strip():
                     # Agregar respuesta del bot
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": bot_response
-                    })
-                    
-                    # Mostrar respuesta del bot
-                    st.markdown(f"""
-                    <div class="bot-message fade-in">
-                    <strong>💙 Ripsy:</strong><br>
-                        {bot_response}
-                    </div>
-                    """, unsafe_allow_html=True)
+                    add_message(role="assistant", content=bot_response.strip())
+                    placeholder.markdown(cached_message_html(st.session_state.messages[-1]), unsafe_allow_html=True)
                 else:
+                    placeholder.empty()
                     st.error("❌ Error al obtener respuesta del chatbot")
 
-with col2:
-    st.markdown("### 🎯 Características de Ripsy")
-    
-    # Organizar en 2 columnas usando CSS flexbox para evitar anidamiento
-    features_data = [
-        {
-            "icon": "🧠",
-            "title": "IA Avanzada",
-            "description": "Powered by OpenAI GPT-4o-mini"
-        },
-        {
-            "icon": "🏥",
-            "title": "RIPS Expert",
-            "description": "Especialista en registros de salud"
-        },
-        {
-            "icon": "🔬",
-            "title": "Auditoría",
-            "description": "Análisis inteligente de facturas"
-        },
-        {
-            "icon": "📜",
-            "title": "Normativas",
-            "description": "Conocimiento de normativa colombiana"
-        },
-        {
-            "icon": "✅",
-            "title": "Validación",
-            "description": "Verificación automática de datos"
-        },
-        {
-            "icon": "👩‍⚕️",
-            "title": "Asesoría",
-            "description": "Orientación en procesos de salud"
-        }
-    ]
-    
-    # Crear HTML con CSS flexbox para 2 columnas
-    left_features = features_data[:3]  # Primeras 3
-    right_features = features_data[3:]  # Últimas 3
-    
-    st.markdown("""
-    <div style="display: flex; gap: 1rem; margin: 1rem 0;">
-        <div style="flex: 1;">
-    """, unsafe_allow_html=True)
-    
-    # Columna izquierda
-    for feature in left_features:
-        st.markdown(f"""
-        <div class="feature-card fade-in">
-            <h4>{feature['icon']} {feature['title']}</h4>
-            <p>{feature['description']}</p>
-        </div>
-        """, unsafe_allow_html=True)
+    with col2:
+        st.markdown("### 🎯 Características de Ripsy")
     
-    st.markdown("""
-        </div>
-        <div style="flex: 1;">
-    """, unsafe_allow_html=True)
-    
-    # Columna derecha
-    for feature in right_features:
-        st.markdown(f"""
-        <div class="feature-card fade-in">
-            <h4>{feature['icon']} {feature['title']}</h4>
-            <p>{feature['description']}</p>
-        </div>
-        """, unsafe_allow_html=True)
+        # Tarjetas estáticas: un solo bloque HTML construido una vez
+        st.markdown(_features_html(), unsafe_allow_html=True)
     
-    st.markdown("""
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    st.markdown("### 📈 Métricas en Tiempo Real")
-    
-    # Métricas en una sola fila sin columnas anidadas
-    st.markdown("""
-    <div style="display: flex; gap: 1rem; margin: 1rem 0;">
-        <div class="metric-card" style="flex: 1;">
-            <h3>💬</h3>
-            <h2>""" + str(len(st.session_state.messages)) + """</h2>
-            <p>Mensajes</p>
-        </div>
-        <div class="metric-card" style="flex: 1;">
-            <h3>⚡</h3>
-            <h2>99%</h2>
-            <p>Disponibilidad</p>
+        st.markdown("### 📈 Métricas en Tiempo Real")
+    
+        # Métricas en una sola fila sin columnas anidadas
+        st.markdown("""
+        <div style="display: flex; gap: 1rem; margin: 1rem 0;">
+            <div class="metric-card" style="flex: 1;">
+                <h3>💬</h3>
+                <h2>""" + str(len(st.session_state.messages)) + """</h2>
+                <p>Mensajes</p>
+            </div>
+            <div class="metric-card" style="flex: 1;">
+                <h3>⚡</h3>
+                <h2>99%</h2>
+                <p>Disponibilidad</p>
+            </div>
         </div>
-    </div>
-    """, unsafe_allow_html=True)
+        """, unsafe_allow_html=True)
 
-with tab2:
+@st.fragment
+def render_glosa_tab():
+    """Pestaña de análisis de probabilidad de glosa"""
     st.markdown("### 🔍 Análisis de Probabilidad de Glosa")
     st.markdown("Sube una factura y una historia clínica en PDF para analizar la probabilidad de glosa.")
     
@@ -495,11 +605,11 @@ with tab2:
     if st.button("🔬 Analizar Probabilidad de Glosa", type="primary", use_container_width=True):
         if factura and historia:
             with st.spinner("🧠 Ripsy está analizando los documentos..."):
-                # Obtener contenido de los archivos
-                factura_content = factura.getvalue()
-                historia_content = historia.getvalue()
-                
-                resultado = analizar_glosa(factura_content, historia_content)
+                # Mismo par de PDFs => resultado en caché, sin volver a llamar a la API
+                try:
+                    resultado = analizar_glosa_cached(pdf_pair_key(factura, historia), factura, historia)
+                except ApiError:
+                    resultado = None
                 
                 if resultado and resultado.get("ok"):
                     # Mostrar resultados
@@ -563,7 +673,9 @@ with tab2:
         else:
             st.warning("⚠️ Por favor, sube tanto la factura como la historia clínica en formato PDF.")
 
-with tab3:
+@st.fragment
+def render_rips_tab():
+    """Pestaña de generación de archivos RIPS"""
     st.markdown("### 📂 Generador de RIPS Automatizado")
     st.markdown("Genera los archivos planos (AF, US, AP, AC, AM, AT) a partir de la factura e historia clínica.")
     
@@ -597,11 +709,11 @@ with tab3:
     if st.button("⚡ Generar Archivos RIPS", type="primary", use_container_width=True):
         if factura_rips and historia_rips:
             with st.spinner("⚙️ Procesando documentos y generando RIPS..."):
-                # Obtener contenido
-                factura_content = factura_rips.getvalue()
-                historia_content = historia_rips.getvalue()
-                
-                resultado = generar_rips(factura_content, historia_content)
+                # Mismo par de PDFs => resultado en caché, sin volver a llamar a la API
+                try:
+                    resultado = generar_rips_cached(pdf_pair_key(factura_rips, historia_rips), factura_rips, historia_rips)
+                except ApiError:
+                    resultado = None
                 
                 if resultado and resultado.get("ok"):
                     st.success("✅ ¡Generación Exitosa!")
@@ -638,29 +750,32 @@ with tab3:
                     
                     for tipo, contenido in rips_data.items():
                         if contenido:
-                            # Si es lista, unir con saltos de línea
-                            if isinstance(contenido, list):
-                                text_data = "\\n".join(contenido)
-                            else:
-                                text_data = contenido
-                                
+                            # El archivo se arma solo cuando el usuario hace clic en descargar
                             st.download_button(
                                 label=f"Descargar {tipo}.txt",
-                                data=text_data,
+                                data=lambda c=contenido: rips_file_bytes(c),
                                 file_name=f"{tipo}.txt",
                                 mime="text/plain",
-                                key=f"download_{tipo}"
+                                key=f"download_{tipo}",
+                                on_click="ignore"
                             )
                 else:
                     st.error("❌ Error al generar RIPS. Revisa los logs del servidor.")
         else:
             st.warning("⚠️ Debes subir ambos archivos para generar los RIPS.")
 
+# Tabs para diferentes funcionalidades
+tab1, tab2, tab3 = st.tabs(["💬 Chat con Ripsy", "🔍 Análisis de Glosa", "📂 Generar RIPS"])
+
+with tab1:
+    render_chat_tab()
+
+with tab2:
+    render_glosa_tab()
+
+with tab3:
+    render_rips_tab()
+
 # Footer
 st.markdown("---")
-st.markdown("""
-<div style="text-align: center; color: #666; padding: 2rem;">
-    <p>💙 <strong>Ripsy</strong> - Desarrollado con amor para la Red de Salud del Oriente E.S.E.</p>
-    <p>Powered by FastAPI + OpenAI + Streamlit</p>
-</div>
-""", unsafe_allow_html=True)
+st.markdown(FOOTER_HTML, unsafe_allow_html=True)
@@ -4,12 +4,23 @@
 from __future__ import annotations
 
 import argparse
-import json
-import subprocess
-import sys
+import contextlib
+import io
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
 from typing import Dict, List, Optional
 
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+import generate_rips as gr_mod
+from rips_generator.json_utils import dump_json_bytes, dump_json_line, load_json_bytes
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Procesa en lote las facturas del directorio FEV_JSON.")
@@ -36,23 +47,32 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Incluye resultados NLP en los JSON generados.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Procesos para generar RIPS en paralelo (por defecto, uno por CPU).",
+    )
     return parser.parse_args()
 
 
 def find_file(directory: Path, pattern_priority: List[str]) -> Optional[Path]:
-    for pattern in pattern_priority:
-        matches = list(directory.glob(pattern))
-        if matches:
-            return matches[0]
-    return None
+    # Generadores encadenados: se detiene en la primera coincidencia, sin listar el resto
+    return next((match for pattern in pattern_priority for match in directory.glob(pattern)), None)
+
+
+def index_pdf_folders(facturas_dir: Path) -> Dict[str, Path]:
+    """Recorre el árbol de facturas una sola vez: nombre de carpeta -> ruta (primera encontrada)."""
+    index: Dict[str, Path] = {}
+    if facturas_dir.exists():
+        for path in facturas_dir.rglob("*"):
+            if path.is_dir():
+                index.setdefault(path.name, path)
+    return index
 
 
-def find_pdf_folder(facturas_dir: Path, factura_id: str) -> Optional[Path]:
-    pattern = f"**/{factura_id}"
-    matches = list(facturas_dir.glob(pattern))
-    if matches:
-        return matches[0]
-    return None
+def find_pdf_folder(pdf_folder_index: Dict[str, Path], factura_id: str) -> Optional[Path]:
+    return pdf_folder_index.get(factura_id)
 
 
 def find_invoice_pdf(pdf_folder: Optional[Path], fev_subdir: Path) -> Optional[Path]:
@@ -60,119 +80,104 @@ def find_invoice_pdf(pdf_folder: Optional[Path], fev_subdir: Path) -> Optional[P
         preferred = pdf_folder / "FERO.pdf"
         if preferred.exists():
             return preferred
-        candidates = list(pdf_folder.glob("FERO*.pdf"))
-        if candidates:
-            return candidates[0]
-        fallback = list(pdf_folder.glob("*.pdf"))
-        if fallback:
-            return fallback[0]
+        candidate = find_file(pdf_folder, ["FERO*.pdf", "*.pdf"])
+        if candidate:
+            return candidate
 
     # Fallback: buscar dentro del propio paquete FEV (FDE o factura firmada)
-    internal_patterns = ["FDE*.pdf", "FERO*.pdf"]
-    for pattern in internal_patterns:
-        matches = list(fev_subdir.glob(pattern))
-        if matches:
-            return matches[0]
-    return None
+    return find_file(fev_subdir, ["FDE*.pdf", "FERO*.pdf"])
 
 
-def find_history_pdf(histories_dir: Path, document_number: Optional[str], fev_subdir: Path) -> Optional[Path]:
+def find_history_pdf(history_pdfs: List[Path], document_number: Optional[str], fev_subdir: Path) -> Optional[Path]:
     # Preferimos la historia incluida en el paquete FEV (HEV...)
-    hev_matches = list(fev_subdir.glob("HEV*.pdf"))
-    if hev_matches:
-        return hev_matches[0]
+    hev_match = next(fev_subdir.glob("HEV*.pdf"), None)
+    if hev_match:
+        return hev_match
 
     if not document_number:
         return None
-    pattern = f"**/*{document_number}*.pdf"
-    matches = list(histories_dir.glob(pattern))
-    if matches:
-        return matches[0]
-    return None
+    return next((path for path in history_pdfs if document_number in path.name), None)
 
 
 def collect_batch_entries(args: argparse.Namespace) -> List[Dict[str, Optional[str]]]:
-    entries: List[Dict[str, Optional[str]]] = []
     facturas_root = args.fev_dir.parent / "Facturas" / "FACTURAS"
+    fev_subdirs = sorted(args.fev_dir.glob("FERO*/"))
+
+    # Un solo recorrido por árbol; luego cada factura se resuelve con búsquedas en memoria
+    pdf_folder_index = index_pdf_folders(facturas_root)
+    history_pdfs = list(args.histories_dir.rglob("*.pdf")) if args.histories_dir.exists() else []
+
+    # Inspección limitada por E/S (glob + lectura de JSON): hilos, conservando el orden
+    inspect = partial(_inspect_fev_subdir, pdf_folder_index=pdf_folder_index, history_pdfs=history_pdfs)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        return list(executor.map(inspect, fev_subdirs))
+
+
+def _inspect_fev_subdir(
+    fev_subdir: Path, pdf_folder_index: Dict[str, Path], history_pdfs: List[Path]
+) -> Dict[str, Optional[str]]:
+    annex_json = find_file(fev_subdir, ["*_Rips.json"])
+    pdf_folder = find_pdf_folder(pdf_folder_index, fev_subdir.name)
+    invoice_pdf = find_invoice_pdf(pdf_folder, fev_subdir)
+
+    if not invoice_pdf:
+        return {
+            "factura": fev_subdir.name,
+            "invoice_pdf": None,
+            "annex_json": str(annex_json) if annex_json else None,
+            "history_pdf": None,
+            "status": "invoice_pdf_missing",
+            "pdf_folder": str(pdf_folder) if pdf_folder else None,
+            "message": "No se encontró la factura PDF asociada.",
+        }
+
+    if not annex_json:
+        return {
+            "factura": fev_subdir.name,
+            "invoice_pdf": str(invoice_pdf),
+            "annex_json": None,
+            "history_pdf": None,
+            "status": "annex_missing",
+            "pdf_folder": str(pdf_folder) if pdf_folder else None,
+            "message": "No se encontró el anexo RIPS (JSON) necesario para identificar al usuario.",
+        }
 
-    for fev_subdir in sorted(args.fev_dir.glob("FERO*/")):
-        annex_json = find_file(fev_subdir, ["*_Rips.json"])
-        pdf_folder = find_pdf_folder(facturas_root, fev_subdir.name) if facturas_root.exists() else None
-        invoice_pdf = find_invoice_pdf(pdf_folder, fev_subdir)
-
-        if not invoice_pdf:
-            entries.append(
-                {
-                    "factura": fev_subdir.name,
-                    "invoice_pdf": None,
-                    "annex_json": str(annex_json) if annex_json else None,
-                    "history_pdf": None,
-                    "status": "invoice_pdf_missing",
-                    "pdf_folder": str(pdf_folder) if pdf_folder else None,
-                    "message": "No se encontró la factura PDF asociada.",
-                }
-            )
-            continue
-
-        if not annex_json:
-            entries.append(
-                {
-                    "factura": fev_subdir.name,
-                    "invoice_pdf": str(invoice_pdf),
-                    "annex_json": None,
-                    "history_pdf": None,
-                    "status": "annex_missing",
-                    "pdf_folder": str(pdf_folder) if pdf_folder else None,
-                    "message": "No se encontró el anexo RIPS (JSON) necesario para identificar al usuario.",
-                }
-            )
-            continue
-
-        try:
-            data = json.loads(annex_json.read_text())
-            users = data.get("usuarios") or []
-            doc_number = users[0].get("numDocumentoIdentificacion") if users else None
-        except Exception as exc:  # pragma: no cover
-            entries.append(
-                {
-                    "factura": fev_subdir.name,
-                    "invoice_pdf": str(invoice_pdf),
-                    "annex_json": str(annex_json),
-                    "history_pdf": None,
-                    "status": "annex_read_error",
-                    "pdf_folder": str(pdf_folder) if pdf_folder else None,
-                    "message": f"Error leyendo anexo: {exc}",
-                }
-            )
-            continue
-
-        history_pdf = find_history_pdf(args.histories_dir, doc_number, fev_subdir)
-        if history_pdf is None:
-            entries.append(
-                {
-                    "factura": fev_subdir.name,
-                    "invoice_pdf": str(invoice_pdf),
-                    "annex_json": str(annex_json),
-                    "history_pdf": None,
-                    "status": "history_not_found",
-                    "pdf_folder": str(pdf_folder) if pdf_folder else None,
-                    "message": f"No se encontró historia PDF que contenga {doc_number}.",
-                }
-            )
-            continue
-
-        entries.append(
-            {
-                "factura": fev_subdir.name,
-                "invoice_pdf": str(invoice_pdf),
-                "annex_json": str(annex_json),
-                "history_pdf": str(history_pdf),
-                "status": "pending",
-                "pdf_folder": None,
-                "message": "",
-            }
-        )
-    return entries
+    try:
+        data = load_json_bytes(annex_json.read_bytes())
+        users = data.get("usuarios") or []
+        doc_number = users[0].get("numDocumentoIdentificacion") if users else None
+    except Exception as exc:  # pragma: no cover
+        return {
+            "factura": fev_subdir.name,
+            "invoice_pdf": str(invoice_pdf),
+            "annex_json": str(annex_json),
+            "history_pdf": None,
+            "status": "annex_read_error",
+            "pdf_folder": str(pdf_folder) if pdf_folder else None,
+            "message": f"Error leyendo anexo: {exc}",
+        }
+
+    history_pdf = find_history_pdf(history_pdfs, doc_number, fev_subdir)
+    if history_pdf is None:
+        return {
+            "factura": fev_subdir.name,
+            "invoice_pdf": str(invoice_pdf),
+            "annex_json": str(annex_json),
+            "history_pdf": None,
+            "status": "history_not_found",
+            "pdf_folder": str(pdf_folder) if pdf_folder else None,
+            "message": f"No se encontró historia PDF que contenga {doc_number}.",
+        }
+
+    return {
+        "factura": fev_subdir.name,
+        "invoice_pdf": str(invoice_pdf),
+        "annex_json": str(annex_json),
+        "history_pdf": str(history_pdf),
+        "status": "pending",
+        "pdf_folder": None,
+        "message": "",
+    }
 
 
 def run_generation(entry: Dict[str, Optional[str]], args: argparse.Namespace) -> Dict[str, Optional[str]]:
@@ -185,43 +190,32 @@ def run_generation(entry: Dict[str, Optional[str]], args: argparse.Namespace) ->
     output_dir.mkdir(parents=True, exist_ok=True)
     output_json = output_dir / f"{factura}_rips.json"
 
-    cmd = [
-        sys.executable,
-        str(Path(__file__).parent / "generate_rips.py"),
-        "--invoice-pdf",
-        invoice_pdf,
-        "--history-pdf",
-        history_pdf,
-    ]
-    if annex_json:
-        cmd.extend(["--annex-rips-json", annex_json])
-    cmd.extend(
-        [
-            "--output-json",
-            str(output_json),
-            "--output-dir",
-            str(output_dir),
-        ]
-    )
-    if args.include_nlp_details:
-        cmd.append("--include-nlp-details")
-
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        # Ejecución en el mismo proceso: los módulos se importan una sola vez para todo el lote
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            gr_mod.run(
+                invoice_pdf=Path(invoice_pdf),
+                history_pdf=Path(history_pdf),
+                output_json=output_json,
+                annex_rips_json=Path(annex_json) if annex_json else None,
+                output_dir=output_dir,
+                include_nlp_details=args.include_nlp_details,
+            )
         entry.update(
             {
                 "status": "completed",
-                "message": result.stdout.strip(),
+                "message": stdout.getvalue().strip(),
                 "output_json": str(output_json),
                 "output_dir": str(output_dir),
                 "pdf_folder": entry.get("pdf_folder"),
             }
         )
-    except subprocess.CalledProcessError as exc:
+    except Exception as exc:
         entry.update(
             {
                 "status": "error",
-                "message": exc.stderr or exc.stdout or str(exc),
+                "message": f"{type(exc).__name__}: {exc}",
                 "pdf_folder": entry.get("pdf_folder"),
             }
         )
@@ -233,15 +227,33 @@ def main() -> None:
     args.output_base.mkdir(parents=True, exist_ok=True)
 
     entries = collect_batch_entries(args)
-    processed: List[Dict[str, Optional[str]]] = []
-    for entry in entries:
-        if entry["status"] == "pending":
-            processed.append(run_generation(entry, args))
-        else:
-            processed.append(entry)
+    pending = [entry for entry in entries if entry["status"] == "pending"]
 
+    # Cada entrada se persiste como una línea NDJSON apenas termina: el avance sobrevive a una caída
     summary_path = args.output_base / "batch_summary.json"
-    summary_path.write_text(json.dumps(processed, ensure_ascii=False, indent=2), encoding="utf-8")
+    progress_path = summary_path.with_suffix(".ndjson")
+    with progress_path.open("wb") as progress:
+        for entry in entries:
+            if entry["status"] != "pending":
+                progress.write(dump_json_line(entry))
+        progress.flush()
+
+        # Generación limitada por CPU (parseo de PDF): procesos
+        if pending:
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                futures = [executor.submit(run_generation, entry, args) for entry in pending]
+                for future in as_completed(futures):
+                    progress.write(dump_json_line(future.result()))
+                    progress.flush()
+
+    # Resumen consolidado a partir del NDJSON, en el orden original de las facturas
+    generated: Dict[str, Dict[str, Optional[str]]] = {}
+    with progress_path.open("rb") as progress:
+        for line in progress:
+            entry = load_json_bytes(line)
+            generated[entry["factura"]] = entry
+    processed: List[Dict[str, Optional[str]]] = [generated.get(entry["factura"], entry) for entry in entries]
+    summary_path.write_bytes(dump_json_bytes(processed))
 
     totals = {
         "total": len(processed),
@@ -249,7 +261,7 @@ def main() -> None:
         "skipped": sum(1 for e in processed if e["status"] not in {"completed", "error"}),
         "errors": sum(1 for e in processed if e["status"] == "error"),
     }
-    print(json.dumps(totals, indent=2, ensure_ascii=False))
+    print(dump_json_bytes(totals).decode("utf-8"))
     print(f"[OK] Resumen guardado en {summary_path}")
 
 
@@ -4,9 +4,8 @@
 from __future__ import annotations
 
 import argparse
-import json
 from pathlib import Path
-from typing import Iterable, List
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import sys
 
@@ -15,9 +14,20 @@ SRC = ROOT / "src"
 if str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
 
-from rips_generator import ClinicalEntityExtractor, HistoryParser  # noqa: E402
+from rips_generator import HistoryParser  # noqa: E402
+from rips_generator.batch_utils import (  # noqa: E402
+    Extractor,
+    LoadedText,
+    add_batch_arguments,
+    iter_batch_results,
+    iter_pdf_paths,
+    open_pool,
+    progress,
+    size_batches,
+)
 from rips_generator.history_nlp import TransformerConfig  # noqa: E402
-from rips_generator.pdf_utils import extract_pdf_text
+from rips_generator.json_utils import dump_json_line
+from rips_generator.pdf_utils import dedupe_pdfs
 
 
 def parse_args() -> argparse.Namespace:
@@ -27,62 +37,136 @@ def parse_args() -> argparse.Namespace:
         nargs="+",
         help="Historias clínicas en PDF (acepta directorios y globs).",
     )
-    parser.add_argument("--output-json", default="nlp_dataset.json", help="Archivo de salida (JSON).")
+    parser.add_argument(
+        "--format",
+        choices=("json", "jsonl"),
+        default="json",
+        help=(
+            "json: un arreglo JSON (por defecto). jsonl: un registro por línea (JSON Lines), "
+            "recomendado para corpus grandes porque se puede leer registro a registro. "
+            "Ambos se escriben a disco a medida que llegan los resultados."
+        ),
+    )
+    parser.add_argument(
+        "--output-json",
+        help="Archivo de salida (por defecto nlp_dataset.json o nlp_dataset.jsonl según --format; "
+        "export_nlp_dataset_csv.py reconoce JSON Lines por la extensión .jsonl).",
+    )
     parser.add_argument("--disable-transformer", action="store_true", help="Solo heurísticas; no intenta cargar modelos grandes.")
-    return parser.parse_args()
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+    if args.output_json is None:
+        args.output_json = f"nlp_dataset.{args.format}"
+    return args
+
+
+def _process_loaded(items: List[LoadedText], extractor: Extractor) -> List[Tuple[Path, dict]]:
+    """Procesa un grupo de historias ya leídas: parser por archivo y una sola llamada NLP para todo el grupo."""
+    records: Dict[Path, dict] = {}
+    loaded = []
+    for pdf_path, text, error in items:
+        try:
+            if error is not None:
+                raise RuntimeError(error)
+            loaded.append((pdf_path, text, HistoryParser.from_text(pdf_path, text).parse()))
+        except Exception as exc:
+            records[pdf_path] = {"history": str(pdf_path), "error": str(exc)}
 
+    try:
+        nlp_results = extractor.extract_batch([text for _, text, _ in loaded])
+    except Exception as exc:
+        nlp_results = [exc] * len(loaded)
 
-def iter_histories(paths: Iterable[str]) -> Iterable[Path]:
-    for raw in paths:
-        path = Path(raw)
-        if path.is_dir():
-            yield from path.rglob("*.pdf")
-        elif "*" in raw:
-            yield from Path().glob(raw)
-        else:
-            yield path
+    for (pdf_path, _, parsed), nlp_result in zip(loaded, nlp_results):
+        if isinstance(nlp_result, Exception):
+            records[pdf_path] = {"history": str(pdf_path), "error": str(nlp_result)}
+            continue
+        records[pdf_path] = {
+            "history": str(pdf_path),
+            "parser_principal_diagnosis": parsed.principal_diagnosis_code,
+            "parser_consultations": [c.code for c in parsed.consultations],
+            "nlp_diagnoses": [
+                {"code": ent.code, "text": ent.text, "score": ent.score, "label": ent.label}
+                for ent in nlp_result.diagnoses
+            ],
+            "nlp_procedures": [
+                {"code": ent.code, "text": ent.text, "score": ent.score, "label": ent.label}
+                for ent in nlp_result.procedures
+            ],
+        }
+    return [(pdf_path, records[pdf_path]) for pdf_path, _, _ in items]
+
+
+def _in_input_order(
+    results: Iterator[Tuple[Path, dict]], entries: List[Tuple[Path, Optional[Path]]]
+) -> Iterator[Tuple[Path, Optional[Path], dict]]:
+    """Reordena los resultados al orden de entrada; solo retiene lo que llega adelantado."""
+    aliased = {canonical for _, canonical in entries if canonical is not None}
+    ready: Dict[Path, dict] = {}
+    for path, canonical in entries:
+        key = canonical or path
+        while key not in ready:
+            done_path, done_record = next(results)
+            ready[done_path] = done_record
+        # Los registros con copias se conservan para reutilizarlos más adelante
+        record = ready[key] if key in aliased else ready.pop(key)
+        yield path, canonical, record
+
+
+def _in_completion_order(
+    results: Iterator[Tuple[Path, dict]], entries: List[Tuple[Path, Optional[Path]]]
+) -> Iterator[Tuple[Path, Optional[Path], dict]]:
+    """Entrega cada registro apenas termina, seguido de sus copias por contenido."""
+    aliases: Dict[Path, List[Path]] = {}
+    for path, canonical in entries:
+        if canonical is not None:
+            aliases.setdefault(canonical, []).append(path)
+    for path, record in results:
+        yield path, None, record
+        for alias in aliases.get(path, ()):
+            yield alias, path, record
 
 
 def main() -> None:
     args = parse_args()
-    config = TransformerConfig(enabled=not args.disable_transformer, local_files_only=True)
-    extractor = ClinicalEntityExtractor(config=config)
-
-    dataset: List[dict] = []
-
-    for pdf_path in iter_histories(args.input_paths):
-        try:
-            parser = HistoryParser(pdf_path)
-            parsed = parser.parse()
-            text = extract_pdf_text(pdf_path)
-            nlp_result = extractor.extract(text)
-        except Exception as exc:
-            dataset.append(
-                {
-                    "history": str(pdf_path),
-                    "error": str(exc),
-                }
-            )
-            continue
-
-        dataset.append(
-            {
-                "history": str(pdf_path),
-                "parser_principal_diagnosis": parsed.principal_diagnosis_code,
-                "parser_consultations": [c.code for c in parsed.consultations],
-                "nlp_diagnoses": [
-                    {"code": ent.code, "text": ent.text, "score": ent.score, "label": ent.label}
-                    for ent in nlp_result.diagnoses
-                ],
-                "nlp_procedures": [
-                    {"code": ent.code, "text": ent.text, "score": ent.score, "label": ent.label}
-                    for ent in nlp_result.procedures
-                ],
-            }
+    config = TransformerConfig(
+        enabled=not args.disable_transformer,
+        local_files_only=True,
+        quantization=args.quantization,
+    )
+    # Los PDF idénticos se procesan una vez; las copias reutilizan el registro con "aliased_from"
+    entries = list(dedupe_pdfs(iter_pdf_paths(args.input_paths)))
+    batches = size_batches((path for path, canonical in entries if canonical is None), args.batch_size)
+
+    # Cada registro se escribe apenas llega: la memoria no crece con el tamaño del corpus
+    count = 0
+    with Path(args.output_json).open("wb") as output, open_pool(config, args.cache_dir, args.jobs) as pool:
+        if args.format == "json":
+            output.write(b"[")
+        results = iter_batch_results(
+            pool,
+            _process_loaded,
+            batches,
+            ordered=args.ordered,
+            chunksize=args.chunksize,
+            text_threads=args.text_threads,
+            jobs=args.jobs,
+            cache_dir=args.cache_dir,
         )
-
-    Path(args.output_json).write_text(json.dumps(dataset, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"[OK] Dataset generado con {len(dataset)} registros en {args.output_json}")
+        emitted = _in_input_order(results, entries) if args.ordered else _in_completion_order(results, entries)
+        for path, canonical, record in progress(emitted, total=len(entries)):
+            if canonical is not None:
+                record = dict(record, history=str(path), aliased_from=str(canonical))
+            line = dump_json_line(record)
+            if args.format == "jsonl":
+                output.write(line)
+            else:
+                output.write((b"\n" if count == 0 else b",\n") + line[:-1])
+            count += 1
+        if args.format == "json":
+            output.write(b"\n]\n")
+
+    print(f"[OK] Dataset generado con {count} registros en {args.output_json}")
 
 
 if __name__ == "__main__":
@@ -4,7 +4,6 @@
 from __future__ import annotations
 
 import argparse
-import json
 from pathlib import Path
 from typing import Dict, List
 
@@ -16,6 +15,8 @@ if str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
 
 from rips_generator import ClinicalEntityExtractor, HistoryParser  # noqa: E402
+from rips_generator.history_nlp import TransformerConfig  # noqa: E402
+from rips_generator.json_utils import dump_json_bytes
 from rips_generator.pdf_utils import extract_pdf_text
 
 
@@ -35,8 +36,6 @@ def main() -> None:
     parser = HistoryParser(args.history_pdf)
     parsed = parser.parse()
 
-    from rips_generator.history_nlp import TransformerConfig  # import tardío
-
     config = TransformerConfig(
         model_name=args.model_name,
         local_files_only=args.local_files_only,
@@ -71,10 +70,10 @@ def main() -> None:
     }
 
     if args.output_json:
-        args.output_json.write_text(json.dumps(comparison, ensure_ascii=False, indent=2), encoding="utf-8")
+        args.output_json.write_bytes(dump_json_bytes(comparison))
         print(f"[OK] Comparación guardada en {args.output_json}")
     else:
-        print(json.dumps(comparison, ensure_ascii=False, indent=2))
+        print(dump_json_bytes(comparison).decode("utf-8"))
 
 
 if __name__ == "__main__":
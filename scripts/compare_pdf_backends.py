@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Verifica que PyMuPDF produzca el mismo resultado de parseo que pdfplumber.
+
+Las reglas de los parsers están ajustadas al texto de pdfplumber; antes de activar
+``RIPS_PDF_BACKEND=pymupdf`` conviene correr este script sobre PDFs de muestra.
+Termina con código 1 si algún campo parseado difiere entre motores.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from rips_generator import HistoryParser, InvoiceParser  # noqa: E402
+from rips_generator.pdf_utils import PDF_BACKEND_ENV, PDF_BACKENDS, extract_pdf_text  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compara el parseo de PDFs con pdfplumber vs PyMuPDF.")
+    parser.add_argument("--history-pdf", type=Path, nargs="*", default=[], help="Historias clínicas de muestra.")
+    parser.add_argument("--invoice-pdf", type=Path, nargs="*", default=[], help="Facturas de muestra.")
+    return parser.parse_args()
+
+
+@contextmanager
+def _backend(name: str) -> Iterator[None]:
+    # InvoiceParser lee el PDF internamente: el motor se elige por variable de entorno
+    previous = os.environ.get(PDF_BACKEND_ENV)
+    os.environ[PDF_BACKEND_ENV] = name
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop(PDF_BACKEND_ENV, None)
+        else:
+            os.environ[PDF_BACKEND_ENV] = previous
+
+
+def _parse(path: Path, kind: str) -> Dict[str, Any]:
+    try:
+        if kind == "historia":
+            return asdict(HistoryParser.from_text(path, extract_pdf_text(path)).parse())
+        return asdict(InvoiceParser(path).parse())
+    except Exception as exc:  # un motor puede fallar donde el otro no: también es diferencia
+        return {"error": f"{type(exc).__name__}: {exc}"}
+
+
+def _differences(path: Path, kind: str) -> List[str]:
+    results = []
+    for name in PDF_BACKENDS:
+        with _backend(name):
+            results.append(_parse(path, kind))
+    base, other = results
+    return [
+        f"{field}: {base.get(field)!r} != {other.get(field)!r}"
+        for field in dict.fromkeys([*base, *other])
+        if base.get(field) != other.get(field)
+    ]
+
+
+def main() -> None:
+    args = parse_args()
+    samples = [(path, "historia") for path in args.history_pdf] + [(path, "factura") for path in args.invoice_pdf]
+    if not samples:
+        sys.exit("Indica al menos un PDF con --history-pdf o --invoice-pdf.")
+
+    failures = 0
+    for path, kind in samples:
+        diffs = _differences(path, kind)
+        if diffs:
+            failures += 1
+            print(f"[DIFF] {kind} {path}")
+            for line in diffs:
+                print(f"    {line}")
+        else:
+            print(f"[OK] {kind} {path}")
+
+    print(f"{len(samples) - failures}/{len(samples)} PDFs con el mismo resultado en {' y '.join(PDF_BACKENDS)}.")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,10 @@
 from __future__ import annotations
 
 import argparse
-import json
 from collections import Counter
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Iterable, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import sys
 
@@ -17,9 +16,20 @@ SRC = ROOT / "src"
 if str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
 
-from rips_generator import ClinicalEntityExtractor, HistoryParser  # noqa: E402
+from rips_generator import HistoryParser  # noqa: E402
+from rips_generator.batch_utils import (  # noqa: E402
+    Extractor,
+    LoadedText,
+    add_batch_arguments,
+    iter_batch_results,
+    iter_pdf_paths,
+    open_pool,
+    progress,
+    size_batches,
+)
 from rips_generator.history_nlp import TransformerConfig  # noqa: E402
-from rips_generator.pdf_utils import extract_pdf_text
+from rips_generator.json_utils import dump_json_bytes, write_json_stream
+from rips_generator.pdf_utils import dedupe_pdfs
 
 
 @dataclass
@@ -30,6 +40,7 @@ class EvaluationRecord:
     nlp_diagnoses: List[str]
     nlp_procedures: List[str]
     matched_diagnosis: bool
+    aliased_from: Optional[Path] = None
 
 
 def parse_args() -> argparse.Namespace:
@@ -44,17 +55,39 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--model-name", default="PlanTL-GOB-ES/roberta-base-biomedical-es", help="Modelo HuggingFace a utilizar.")
     parser.add_argument("--local-files-only", action="store_true", help="No intenta descargar modelos (solo archivos locales).")
     parser.add_argument("--disable-transformer", action="store_true", help="Usar exclusivamente heurísticas (sin modelo).")
+    add_batch_arguments(parser)
     return parser.parse_args()
 
 
-def iter_history_files(paths: Iterable[Path]) -> Iterable[Path]:
-    for path in paths:
-        if path.is_dir():
-            yield from path.rglob("*.pdf")
-        elif "*" in str(path):
-            yield from Path().glob(str(path))
-        else:
-            yield path
+def _process_loaded(items: List[LoadedText], extractor: Extractor) -> List[Tuple[Path, Optional[EvaluationRecord]]]:
+    """Evalúa un grupo de historias ya leídas con una sola llamada NLP; ``None`` donde el parser falla."""
+    loaded = []
+    for history_path, text, _ in items:
+        if text is None:
+            continue
+        try:
+            loaded.append((history_path, text, HistoryParser.from_text(history_path, text).parse()))
+        except Exception:
+            continue
+
+    nlp_results = extractor.extract_batch([text for _, text, _ in loaded])
+
+    records: Dict[Path, EvaluationRecord] = {}
+    for (history_path, _, parsed), nlp_result in zip(loaded, nlp_results):
+        parser_diag = parsed.principal_diagnosis_code
+        nlp_diag_codes = [ent.code for ent in nlp_result.diagnoses if ent.code]
+        nlp_proc_codes = [ent.code for ent in nlp_result.procedures if ent.code]
+        matched = parser_diag in nlp_diag_codes if parser_diag else False
+
+        records[history_path] = EvaluationRecord(
+            history_path=history_path,
+            parser_diagnosis=parser_diag,
+            parser_consultations=[c.code for c in parsed.consultations],
+            nlp_diagnoses=nlp_diag_codes,
+            nlp_procedures=nlp_proc_codes,
+            matched_diagnosis=matched,
+        )
+    return [(history_path, records.get(history_path)) for history_path, _, _ in items]
 
 
 def evaluate_histories(args: argparse.Namespace) -> Tuple[List[EvaluationRecord], Counter]:
@@ -62,16 +95,50 @@ def evaluate_histories(args: argparse.Namespace) -> Tuple[List[EvaluationRecord]
         model_name=args.model_name,
         local_files_only=args.local_files_only,
         enabled=not args.disable_transformer,
+        quantization=args.quantization,
     )
-    extractor = ClinicalEntityExtractor(config=config)
+    # Los PDF idénticos se evalúan una vez; las copias heredan el resultado de la ruta canónica
+    entries = list(dedupe_pdfs(iter_pdf_paths(args.history_paths)))
+    unique_paths = [path for path, canonical in entries if canonical is None]
     stats = Counter()
     records: List[EvaluationRecord] = []
 
-    for history_path in iter_history_files(args.history_paths):
-        try:
-            parser = HistoryParser(history_path)
-            parsed = parser.parse()
-        except Exception as exc:
+    batches = size_batches(unique_paths, args.batch_size)
+    ordered = args.ordered
+
+    results: Dict[Path, Optional[EvaluationRecord]] = {}
+    with open_pool(config, args.cache_dir, args.jobs) as pool:
+        completed = iter_batch_results(
+            pool,
+            _process_loaded,
+            batches,
+            ordered=ordered,
+            chunksize=args.chunksize,
+            text_threads=args.text_threads,
+            jobs=args.jobs,
+            cache_dir=args.cache_dir,
+        )
+        for history_path, record in progress(completed, total=len(unique_paths)):
+            results[history_path] = record
+
+    if ordered:
+        emit_order = entries
+    else:
+        # Orden de término, con cada copia justo después de su PDF canónico
+        aliases: Dict[Path, List[Path]] = {}
+        for history_path, canonical in entries:
+            if canonical is not None:
+                aliases.setdefault(canonical, []).append(history_path)
+        emit_order = []
+        for history_path in results:
+            emit_order.append((history_path, None))
+            emit_order.extend((alias, history_path) for alias in aliases.get(history_path, ()))
+
+    for history_path, canonical in emit_order:
+        record = results[canonical or history_path]
+        if record is not None and canonical is not None:
+            record = replace(record, history_path=history_path, aliased_from=canonical)
+        if record is None:
             stats["parse_error"] += 1
             records.append(
                 EvaluationRecord(
@@ -81,36 +148,19 @@ def evaluate_histories(args: argparse.Namespace) -> Tuple[List[EvaluationRecord]
                     nlp_diagnoses=[],
                     nlp_procedures=[],
                     matched_diagnosis=False,
+                    aliased_from=canonical,
                 )
             )
             continue
 
-        text = extract_pdf_text(history_path)
-        nlp_result = extractor.extract(text)
-
-        parser_diag = parsed.principal_diagnosis_code
-        nlp_diag_codes = [ent.code for ent in nlp_result.diagnoses if ent.code]
-        nlp_proc_codes = [ent.code for ent in nlp_result.procedures if ent.code]
-        matched = parser_diag in nlp_diag_codes if parser_diag else False
-
         stats["total"] += 1
-        if parser_diag:
+        if record.parser_diagnosis:
             stats["parser_diag_present"] += 1
-        if nlp_diag_codes:
+        if record.nlp_diagnoses:
             stats["nlp_diag_present"] += 1
-        if matched:
+        if record.matched_diagnosis:
             stats["diag_match"] += 1
-
-        records.append(
-            EvaluationRecord(
-                history_path=history_path,
-                parser_diagnosis=parser_diag,
-                parser_consultations=[c.code for c in parsed.consultations],
-                nlp_diagnoses=nlp_diag_codes,
-                nlp_procedures=nlp_proc_codes,
-                matched_diagnosis=matched,
-            )
-        )
+        records.append(record)
 
     return records, stats
 
@@ -128,8 +178,8 @@ def main() -> None:
         "transformer_enabled": not args.disable_transformer,
     }
 
-    # Prepare detailed records
-    details = [
+    # Detalle por historia como generador: se serializa registro a registro
+    details = (
         {
             "history": str(record.history_path),
             "parser_diagnosis": record.parser_diagnosis,
@@ -137,17 +187,16 @@ def main() -> None:
             "nlp_diagnoses": record.nlp_diagnoses,
             "nlp_procedures": record.nlp_procedures,
             "matched_diagnosis": record.matched_diagnosis,
+            **({"aliased_from": str(record.aliased_from)} if record.aliased_from else {}),
         }
         for record in records
-    ]
-
-    output = {"summary": summary, "details": details}
+    )
 
     if args.output_json:
-        args.output_json.write_text(json.dumps(output, ensure_ascii=False, indent=2), encoding="utf-8")
+        write_json_stream(args.output_json, {"summary": summary, "details": details})
         print(f"[OK] Reporte guardado en {args.output_json}")
     else:
-        print(json.dumps(output, ensure_ascii=False, indent=2))
+        print(dump_json_bytes({"summary": summary, "details": list(details)}).decode("utf-8"))
 
 
 if __name__ == "__main__":
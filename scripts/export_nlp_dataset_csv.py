@@ -5,10 +5,17 @@ from __future__ import annotations
 
 import argparse
 import csv
-import json
+import sys
 from pathlib import Path
 from typing import Any, Dict, List
 
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from rips_generator.json_utils import load_json_bytes  # noqa: E402
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Convierte nlp_dataset.json en un CSV para anotación.")
@@ -17,14 +24,26 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
+_EMPTY = ""
+_join = ";".join
+
+
 def normalize_codes(entries: List[Dict[str, Any]]) -> str:
-    unique = {entry.get("code") for entry in entries if entry.get("code")}
-    return ";".join(sorted(unique)) if unique else ""
+    codes = [code for entry in entries if (code := entry.get("code"))]
+    if len(codes) > 1:
+        return _join(sorted(set(codes)))
+    return codes[0] if codes else _EMPTY
 
 
 def main() -> None:
     args = parse_args()
-    data = json.loads(Path(args.input_json).read_text())
+    input_path = Path(args.input_json)
+    if input_path.suffix == ".jsonl":
+        # Salida de build_nlp_dataset.py --format jsonl: un registro por línea
+        with input_path.open("rb") as handle:
+            data = [load_json_bytes(line) for line in handle if line.strip()]
+    else:
+        data = load_json_bytes(input_path.read_bytes())
 
     fieldnames = [
         "history",
@@ -37,22 +56,25 @@ def main() -> None:
         "comments",
     ]
 
+    # Filas posicionales (mismo orden que fieldnames); las columnas manuales quedan vacías
+    rows = (
+        (
+            record.get("history"),
+            record.get("parser_principal_diagnosis"),
+            _join(record.get("parser_consultations") or ()),
+            normalize_codes(record.get("nlp_diagnoses") or ()),
+            normalize_codes(record.get("nlp_procedures") or ()),
+            _EMPTY,
+            _EMPTY,
+            _EMPTY,
+        )
+        for record in data
+    )
+
     with Path(args.output_csv).open("w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for record in data:
-            writer.writerow(
-                {
-                    "history": record.get("history"),
-                    "parser_principal_diagnosis": record.get("parser_principal_diagnosis"),
-                    "parser_consultations": ";".join(record.get("parser_consultations") or []),
-                    "nlp_diagnoses": normalize_codes(record.get("nlp_diagnoses") or []),
-                    "nlp_procedures": normalize_codes(record.get("nlp_procedures") or []),
-                    "manual_diagnosis": "",
-                    "manual_procedures": "",
-                    "comments": "",
-                }
-            )
+        writer = csv.writer(csvfile)
+        writer.writerow(fieldnames)
+        writer.writerows(rows)
 
     print(f"[OK] CSV de anotación generado en {args.output_csv}")
 
@@ -4,9 +4,10 @@
 from __future__ import annotations
 
 import argparse
-import json
-from datetime import datetime
+import functools
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any, Dict, Optional
 
 import sys
 
@@ -16,6 +17,7 @@ if str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
 
 from rips_generator import HistoryParser, InvoiceParser, RipsBuilder, RipsJsonAnnexParser, ValidationMessage, validate_rips
+from rips_generator.json_utils import write_json_stream
 from rips_generator.pdf_utils import extract_pdf_text
 from rips_generator.rips_exporter import write_rips_files
 
@@ -31,21 +33,44 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def main() -> None:
-    args = parse_args()
+@functools.cache
+def _nlp_extractor():
+    """Extractor heurístico compartido: se construye una vez por proceso (útil en lotes en proceso)."""
+    from rips_generator.history_nlp import ClinicalEntityExtractor, TransformerConfig  # import tardío
+
+    return ClinicalEntityExtractor(TransformerConfig(enabled=False))
+
 
-    invoice = InvoiceParser(args.invoice_pdf).parse()
-    patient = HistoryParser(args.history_pdf).parse()
+def run(
+    invoice_pdf: Path,
+    history_pdf: Path,
+    output_json: Path,
+    annex_rips_json: Optional[Path] = None,
+    output_dir: Optional[Path] = None,
+    include_nlp_details: bool = False,
+) -> Dict[str, Any]:
+    """Genera los RIPS de una factura, escribe las salidas y devuelve el conteo de registros y validaciones."""
+    invoice_pdf = Path(invoice_pdf)
+    history_pdf = Path(history_pdf)
+    output_json = Path(output_json)
+    annex_rips_json = Path(annex_rips_json) if annex_rips_json else None
+    output_dir = Path(output_dir) if output_dir else None
+
+    invoice = InvoiceParser(invoice_pdf).parse()
+    # El texto de la historia se extrae una sola vez y se comparte con el extractor NLP
+    history_text = extract_pdf_text(history_pdf)
+    patient = HistoryParser.from_text(history_pdf, history_text).parse()
 
     annex_data = None
-    if args.annex_rips_json:
-        annex_data = RipsJsonAnnexParser(args.annex_rips_json).parse()
+    if annex_rips_json:
+        annex_data = RipsJsonAnnexParser(annex_rips_json).parse()
 
     builder = RipsBuilder(invoice=invoice, patient=patient, annex_data=annex_data)
-    procedure_records = builder.build_procedure_records()
-    consultation_records = builder.build_consultation_records()
-    medication_records = builder.build_medication_records()
-    other_service_records = builder.build_other_service_records()
+    # Los registros se reutilizan (validación, planos, JSON y conteos): se materializan una vez
+    procedure_records = list(builder.build_procedure_records())
+    consultation_records = list(builder.build_consultation_records())
+    medication_records = list(builder.build_medication_records())
+    other_service_records = list(builder.build_other_service_records())
     invoice_record = builder.build_invoice_record()
     user_record = builder.build_user_record()
     validation_messages = validate_rips(
@@ -58,12 +83,8 @@ def main() -> None:
     )
 
     nlp_details = None
-    if args.include_nlp_details:
-        from rips_generator.history_nlp import ClinicalEntityExtractor, TransformerConfig
-
-        text_content = extract_pdf_text(args.history_pdf)
-        nlp_extractor = ClinicalEntityExtractor(TransformerConfig(enabled=False))
-        nlp_result = nlp_extractor.extract(text_content)
+    if include_nlp_details:
+        nlp_result = _nlp_extractor().extract(history_text)
         nlp_details = {
             "diagnoses": [
                 {"code": ent.code, "text": ent.text, "label": ent.label, "score": ent.score}
@@ -75,9 +96,9 @@ def main() -> None:
             ],
         }
 
-    if args.output_dir:
+    if output_dir:
         write_rips_files(
-            args.output_dir,
+            output_dir,
             af_records=[invoice_record],
             us_records=[user_record] if user_record else [],
             ap_records=procedure_records,
@@ -86,8 +107,16 @@ def main() -> None:
             at_records=other_service_records,
         )
 
+    # Las líneas de una factura comparten pocas fechas: cada una se formatea una sola vez
+    date_iso = {
+        moment: moment.isoformat()
+        for moment in {record.service_date for record in procedure_records}
+        | {record.consultation_date for record in consultation_records}
+    }
+
+    # Las secciones de registros son generadores: se escriben en disco sin duplicarse en memoria
     payload = {
-        "generated_at": datetime.utcnow().isoformat(),
+        "generated_at": datetime.now(timezone.utc).isoformat(),
         "invoice": {
             "invoice_id": invoice.invoice_id,
             "issue_date": invoice.issue_date.isoformat(),
@@ -111,13 +140,13 @@ def main() -> None:
                 "resolved": builder.resolve_document_number(),
             },
         },
-        "rips_procedures": [
+        "rips_procedures": (
             {
                 "provider_code": record.provider_code,
                 "invoice_number": record.invoice_number,
                 "document_type": record.document_type,
                 "document_number": record.document_number,
-                "service_date": record.service_date.isoformat(),
+                "service_date": date_iso[record.service_date],
                 "cups_code": record.cups_code,
                 "diagnosis_code": record.diagnosis_code,
                 "service_purpose_code": record.service_purpose_code,
@@ -125,17 +154,17 @@ def main() -> None:
                 "net_value": str(record.net_value),
             }
             for record in procedure_records
-        ],
-        "rips_consultations": [
+        ),
+        "rips_consultations": (
             {
                 "consultation_code": record.consultation_code,
-                "consultation_date": record.consultation_date.isoformat(),
+                "consultation_date": date_iso[record.consultation_date],
                 "consultation_value": f"{record.consultation_value:.2f}",
                 "diagnosis_code": record.principal_diagnosis,
             }
             for record in consultation_records
-        ],
-        "rips_medications": [
+        ),
+        "rips_medications": (
             {
                 "medication_code": record.medication_code,
                 "medication_name": record.medication_name,
@@ -143,8 +172,8 @@ def main() -> None:
                 "diagnosis_code": record.principal_diagnosis,
             }
             for record in medication_records
-        ],
-        "rips_other_services": [
+        ),
+        "rips_other_services": (
             {
                 "service_code": record.service_code,
                 "service_name": record.service_name,
@@ -152,31 +181,31 @@ def main() -> None:
                 "diagnosis_code": record.principal_diagnosis,
             }
             for record in other_service_records
-        ],
+        ),
         "rips_invoice": {
             "invoice_number": invoice_record.invoice_number,
             "total_value": str(invoice_record.total_value),
         },
-        "validation_messages": [
+        "validation_messages": (
             {
                 "severity": message.severity,
                 "code": message.code,
                 "message": message.message,
             }
             for message in validation_messages
-        ],
+        ),
         "nlp_support": nlp_details,
-        "output_dir": str(args.output_dir) if args.output_dir else None,
+        "output_dir": str(output_dir) if output_dir else None,
     }
 
-    args.output_json.parent.mkdir(parents=True, exist_ok=True)
-    args.output_json.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    output_json.parent.mkdir(parents=True, exist_ok=True)
+    write_json_stream(output_json, payload)
     message = (
         f"[OK] Se generaron {len(procedure_records)} registros AP, {len(consultation_records)} registros AC, "
-        f"{len(medication_records)} registros AM y {len(other_service_records)} registros AT en {args.output_json}"
+        f"{len(medication_records)} registros AM y {len(other_service_records)} registros AT en {output_json}"
     )
-    if args.output_dir:
-        message += f" y archivos planos en {args.output_dir}"
+    if output_dir:
+        message += f" y archivos planos en {output_dir}"
     errors = sum(1 for msg in validation_messages if msg.severity.upper() == "ERROR")
     warnings = sum(1 for msg in validation_messages if msg.severity.upper() == "WARNING")
     if errors or warnings:
@@ -184,6 +213,26 @@ def main() -> None:
     else:
         message += " | Validación sin inconsistencias."
     print(message)
+    return {
+        "AP": len(procedure_records),
+        "AC": len(consultation_records),
+        "AM": len(medication_records),
+        "AT": len(other_service_records),
+        "errors": errors,
+        "warnings": warnings,
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    run(
+        invoice_pdf=args.invoice_pdf,
+        history_pdf=args.history_pdf,
+        output_json=args.output_json,
+        annex_rips_json=args.annex_rips_json,
+        output_dir=args.output_dir,
+        include_nlp_details=args.include_nlp_details,
+    )
 
 
 if __name__ == "__main__":
@@ -2,20 +2,26 @@
 
 from __future__ import annotations
 
-import json
 from dataclasses import dataclass
 from datetime import datetime
 from decimal import Decimal
 from pathlib import Path
 from typing import Optional
 
+from .json_utils import load_json_bytes
 from .models import (
     AnnexData,
     AnnexMedicationEntry,
     AnnexOtherServiceEntry,
     AnnexPatientInfo,
+    intern_code,
 )
 
+_DEC_ZERO = Decimal("0")
+
+# Respaldo para lo que fromisoformat no acepta (p. ej. "2024-1-5"); el formato más común primero
+ANNEX_DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%fZ")
+
 
 @dataclass
 class RipsJsonAnnexParser:
@@ -24,7 +30,7 @@ class RipsJsonAnnexParser:
     path: Path
 
     def parse(self) -> AnnexData:
-        data = json.loads(self.path.read_text(encoding="utf-8"))
+        data = load_json_bytes(self.path.read_bytes())
 
         usuarios = data.get("usuarios") or []
         if not usuarios:
@@ -36,6 +42,10 @@ class RipsJsonAnnexParser:
         doc_type = usuario.get("tipoDocumentoIdentificacion")
         doc_number = usuario.get("numDocumentoIdentificacion")
         full_name = usuario.get("nombreUsuario")
+        first_name = usuario.get("primerNombre")
+        second_name = usuario.get("segundoNombre")
+        last_name = usuario.get("primerApellido")
+        second_last_name = usuario.get("segundoApellido")
         gender = usuario.get("codSexo")
         birth_date = self._parse_date(usuario.get("fechaNacimiento"))
         municipality_code = usuario.get("codMunicipioResidencia")
@@ -45,6 +55,10 @@ class RipsJsonAnnexParser:
         doc_type = doc_type or None
         doc_number = doc_number or None
         full_name = full_name or None
+        first_name = first_name or None
+        second_name = second_name or None
+        last_name = last_name or None
+        second_last_name = second_last_name or None
         gender = gender or None
         municipality_code = municipality_code or None
         residence_zone = residence_zone or None
@@ -57,6 +71,10 @@ class RipsJsonAnnexParser:
             birth_date=birth_date,
             municipality_code=municipality_code,
             residence_zone=residence_zone,
+            first_name=first_name,
+            second_name=second_name,
+            last_name=last_name,
+            second_last_name=second_last_name,
         )
 
         servicios = usuario.get("servicios", {})
@@ -67,12 +85,26 @@ class RipsJsonAnnexParser:
 
     @staticmethod
     def _parse_date(value: Optional[str]) -> Optional[datetime]:
+        """Fecha del JSON de FEV como ``datetime`` naive.
+
+        >>> RipsJsonAnnexParser._parse_date("1990-05-01T00:00:00-05:00")
+        datetime.datetime(1990, 5, 1, 0, 0)
+        """
         if not value:
             return None
-        value = value.replace("/", "-")
-        for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%fZ"):
+        value = value.strip().replace("/", "-")
+        # Ruta rápida: fromisoformat (en C) cubre fechas y fechas-hora ISO sin excepciones
+        try:
+            parsed = datetime.fromisoformat(value.rstrip("Z"))
+        except ValueError:
+            pass
+        else:
+            # Con desfase (-05:00) sería aware: se conserva la hora escrita y se deja naive
+            # como el resto de fechas del pipeline (las comparaciones mezcladas fallan)
+            return parsed.replace(tzinfo=None)
+        for fmt in ANNEX_DATE_FORMATS:
             try:
-                return datetime.strptime(value[: len(fmt)], fmt)
+                return datetime.strptime(value, fmt)
             except ValueError:
                 continue
         return None
@@ -80,19 +112,24 @@ class RipsJsonAnnexParser:
     @staticmethod
     def _parse_decimal(value) -> Decimal:
         if value is None:
-            return Decimal("0")
-        if isinstance(value, (int, float)):
+            return _DEC_ZERO
+        # En el JSON de FEV los valores suelen llegar como números: se evita el paso por str
+        if isinstance(value, int):
+            return Decimal(value)
+        if isinstance(value, float):
             return Decimal(str(value))
-        value_str = str(value).replace(",", "")
+        value_str = str(value)
+        if "," in value_str:
+            value_str = value_str.replace(",", "")
         try:
             return Decimal(value_str)
         except Exception:
-            return Decimal("0")
+            return _DEC_ZERO
 
     def _parse_medication(self, item: dict) -> AnnexMedicationEntry:
         return AnnexMedicationEntry(
             provider_code=item.get("codPrestador", ""),
-            document_type=item.get("tipoDocumentoIdentificacion"),
+            document_type=intern_code(item.get("tipoDocumentoIdentificacion")),
             document_number=item.get("numDocumentoIdentificacion"),
             authorization_number=item.get("numAutorizacion"),
             medication_code=item.get("codTecnologiaSalud", ""),
@@ -103,8 +140,8 @@ class RipsJsonAnnexParser:
             quantity=self._parse_decimal(item.get("cantidadMedicamento")),
             unit_measure=str(item.get("unidadMinDispensa")) if item.get("unidadMinDispensa") is not None else None,
             treatment_days=item.get("diasTratamiento"),
-            diagnosis_code=item.get("codDiagnosticoPrincipal"),
-            related_diagnosis=item.get("codDiagnosticoRelacionado"),
+            diagnosis_code=intern_code(item.get("codDiagnosticoPrincipal")),
+            related_diagnosis=intern_code(item.get("codDiagnosticoRelacionado")),
             mipres_id=item.get("idMIPRES"),
             administration_date=self._parse_date(item.get("fechaDispensAdmon")),
             pharmaceutical_form=item.get("formaFarmaceutica"),
@@ -114,7 +151,7 @@ class RipsJsonAnnexParser:
     def _parse_other_service(self, item: dict) -> AnnexOtherServiceEntry:
         return AnnexOtherServiceEntry(
             provider_code=item.get("codPrestador", ""),
-            document_type=item.get("tipoDocumentoIdentificacion"),
+            document_type=intern_code(item.get("tipoDocumentoIdentificacion")),
             document_number=item.get("numDocumentoIdentificacion"),
             authorization_number=item.get("numAutorizacion"),
             service_code=item.get("codTecnologiaSalud", ""),
@@ -124,7 +161,7 @@ class RipsJsonAnnexParser:
             unit_value=self._parse_decimal(item.get("vrUnitOS")),
             total_value=self._parse_decimal(item.get("vrServicio")),
             quantity=self._parse_decimal(item.get("cantidadOS")),
-            diagnosis_code=item.get("codDiagnosticoPrincipal"),
-            related_diagnosis=item.get("codDiagnosticoRelacionado"),
+            diagnosis_code=intern_code(item.get("codDiagnosticoPrincipal")),
+            related_diagnosis=intern_code(item.get("codDiagnosticoRelacionado")),
             mipres_id=item.get("idMIPRES"),
         )
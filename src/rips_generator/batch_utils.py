@@ -0,0 +1,213 @@
+"""Procesamiento por lotes de historias clínicas en paralelo (scripts de dataset y evaluación)."""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import glob
+import multiprocessing
+import os
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
+
+from .history_nlp import CachedExtractor, ClinicalEntityExtractor, TransformerConfig
+from .pdf_utils import extract_pdf_text, extract_pdf_text_cached
+
+try:
+    from tqdm import tqdm
+except ImportError:  # pragma: no cover - tqdm es opcional
+    tqdm = None
+
+R = TypeVar("R")
+# (ruta, texto, error): texto es None si el PDF no se pudo leer
+LoadedText = Tuple[Path, Optional[str], Optional[str]]
+Extractor = Union[ClinicalEntityExtractor, CachedExtractor]
+ProcessLoaded = Callable[[List[LoadedText], Extractor], List[Tuple[Path, R]]]
+
+
+def add_batch_arguments(parser: argparse.ArgumentParser) -> None:
+    """Opciones comunes de lotes, paralelismo y caché."""
+    parser.add_argument(
+        "--quantization",
+        choices=("int8", "bf16", "fp32"),
+        default="int8",
+        help="Precisión del modelo transformer en CPU (int8 por defecto).",
+    )
+    parser.add_argument("--batch-size", type=int, default=8, help="Historias por llamada al extractor NLP.")
+    parser.add_argument("--jobs", type=int, default=None, help="Procesos en paralelo (por defecto, uno por CPU).")
+    parser.add_argument(
+        "--text-threads",
+        type=int,
+        default=0,
+        help="Hilos que extraen el texto de los PDF en el proceso principal (0: cada worker lee sus PDF).",
+    )
+    parser.add_argument("--chunksize", type=int, default=2, help="Lotes enviados a cada proceso por tarea.")
+    parser.add_argument("--ordered", action="store_true", help="Conserva el orden de entrada (por defecto, orden de término).")
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        help="Directorio de caché de texto extraído y resultados NLP (se omite si no se indica).",
+    )
+
+
+def progress(iterable: Iterable, total: int) -> Iterable:
+    """Barra de progreso en stderr si tqdm está instalado."""
+    return tqdm(iterable, total=total, unit="pdf") if tqdm else iterable
+
+
+def iter_pdf_paths(paths: Iterable[Union[str, Path]]) -> Iterator[Path]:
+    """Expande directorios (recursivo) y globs; las rutas simples se entregan tal cual."""
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            yield from path.rglob("*.pdf")
+        elif "*" in str(raw):
+            # iglob es perezoso, admite ** y rutas absolutas
+            yield from map(Path, glob.iglob(str(raw), recursive=True))
+        else:
+            yield path
+
+
+def file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def size_batches(paths: Iterable[Path], batch_size: int) -> List[List[Path]]:
+    """Lotes por tamaño de archivo (aprox. longitud del texto) para reducir el padding del modelo."""
+    by_size = sorted(paths, key=file_size)
+    return [by_size[i : i + batch_size] for i in range(0, len(by_size), batch_size)]
+
+
+# Subdirectorio de la caché para el texto de los PDF (junto a los resultados NLP)
+_TEXT_CACHE_SUBDIR = "pdf_text"
+
+
+def load_text(pdf_path: Path, cache_dir: Optional[Path] = None) -> LoadedText:
+    """Extrae el texto de un PDF: ``(ruta, texto, error)``; con ``cache_dir`` lo reutiliza."""
+    try:
+        if cache_dir is not None:
+            return pdf_path, extract_pdf_text_cached(pdf_path, Path(cache_dir) / _TEXT_CACHE_SUBDIR), None
+        return pdf_path, extract_pdf_text(pdf_path), None
+    except Exception as exc:
+        return pdf_path, None, str(exc)
+
+
+# Estado por proceso del pool: el extractor (y su modelo) se carga una vez por worker
+_WORKER: dict = {}
+
+
+def _init_worker(config: TransformerConfig, cache_dir: Optional[Path] = None) -> None:
+    extractor = ClinicalEntityExtractor(config=config)
+    _WORKER["extractor"] = CachedExtractor(extractor, cache_dir) if cache_dir else extractor
+    _WORKER["cache_dir"] = cache_dir
+
+
+def open_pool(config: TransformerConfig, cache_dir: Optional[Path] = None, jobs: Optional[int] = None):
+    """Pool de procesos con un extractor NLP por worker."""
+    return multiprocessing.Pool(jobs or os.cpu_count(), initializer=_init_worker, initargs=(config, cache_dir))
+
+
+def _run_paths(process: ProcessLoaded, group: List[List[Path]]) -> List[Tuple[Path, R]]:
+    extractor, cache_dir = _WORKER["extractor"], _WORKER["cache_dir"]
+    return [
+        pair for batch in group for pair in process([load_text(pdf_path, cache_dir) for pdf_path in batch], extractor)
+    ]
+
+
+def _run_loaded(process: ProcessLoaded, group: List[List[LoadedText]]) -> List[Tuple[Path, R]]:
+    extractor = _WORKER["extractor"]
+    return [pair for items in group for pair in process(items, extractor)]
+
+
+# Tareas enviadas y aún no consumidas por worker: acota la memoria si el consumidor
+# (o el NLP) va más lento que la lectura. imap/imap_unordered no sirven para esto:
+# su hilo interno vacía el iterador de entrada sin esperar a los workers.
+_TASKS_PER_WORKER = 2
+
+
+def _loaded_groups(
+    groups: List[List[List[Path]]], threads: int, ahead: int, cache_dir: Optional[Path] = None
+) -> Iterator[List[List[LoadedText]]]:
+    """Lee el texto de los PDF en hilos, como máximo ``ahead`` grupos por delante del consumidor."""
+    with ThreadPoolExecutor(max_workers=threads) as io_pool:
+        remaining = iter(groups)
+        pending: Deque[list] = deque()
+
+        def read_next() -> None:
+            group = next(remaining, None)
+            if group is not None:
+                pending.append([[io_pool.submit(load_text, pdf_path, cache_dir) for pdf_path in batch] for batch in group])
+
+        for _ in range(ahead):
+            read_next()
+        while pending:
+            futures = pending.popleft()
+            read_next()
+            yield [[future.result() for future in batch] for batch in futures]
+
+
+def _bounded_map(pool, func: Callable, work: Iterable, limit: int, ordered: bool) -> Iterator:
+    """Como ``pool.imap``/``imap_unordered``, pero sin más de ``limit`` tareas pendientes."""
+    if ordered:
+        pending: Deque = deque()
+        for item in work:
+            if len(pending) >= limit:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(func, (item,)))
+        while pending:
+            yield pending.popleft().get()
+        return
+
+    # Los callbacks corren en el hilo de resultados del pool; el hueco se libera al consumir
+    done: "queue.SimpleQueue" = queue.SimpleQueue()
+    in_flight = 0
+    for item in work:
+        if in_flight >= limit:
+            yield _unwrap(done.get())
+            in_flight -= 1
+        pool.apply_async(func, (item,), callback=done.put, error_callback=done.put)
+        in_flight += 1
+    for _ in range(in_flight):
+        yield _unwrap(done.get())
+
+
+def _unwrap(result):
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def iter_batch_results(
+    pool,
+    process: ProcessLoaded,
+    batches: List[List[Path]],
+    ordered: bool = False,
+    chunksize: int = 2,
+    text_threads: int = 0,
+    jobs: Optional[int] = None,
+    cache_dir: Optional[Path] = None,
+) -> Iterator[Tuple[Path, R]]:
+    """Ejecuta ``process`` sobre cada lote en el pool y entrega ``(ruta, resultado)`` por historia.
+
+    ``process`` debe ser una función de módulo (se envía por referencia a los workers).
+    Cada tarea agrupa ``chunksize`` lotes; nunca hay más de ``_TASKS_PER_WORKER`` tareas
+    por worker enviadas sin consumir, ni más textos leídos por adelantado que esas tareas.
+    """
+    groups = [batches[i : i + chunksize] for i in range(0, len(batches), chunksize)]
+    limit = _TASKS_PER_WORKER * (jobs or os.cpu_count() or 1)
+    if text_threads:
+        # Productor/consumidor: hilos leen los PDF mientras los procesos ejecutan parser + NLP
+        tasks = _bounded_map(
+            pool, functools.partial(_run_loaded, process), _loaded_groups(groups, text_threads, limit, cache_dir), limit, ordered
+        )
+    else:
+        tasks = _bounded_map(pool, functools.partial(_run_paths, process), groups, limit, ordered)
+    # Sin ordered los grupos se recogen según terminan: un PDF largo no frena a los demás
+    for group_results in tasks:
+        yield from group_results
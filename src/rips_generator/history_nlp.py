@@ -2,22 +2,31 @@
 
 from __future__ import annotations
 
+import hashlib
 import importlib
 import importlib.util
+import json
 import logging
+import os
 import re
-from dataclasses import dataclass
-from typing import Iterable, List, Optional
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
 
+from .json_utils import dump_json_line, load_json_bytes
 from .models import ClinicalEntity, ClinicalExtractionResult
 
 LOGGER = logging.getLogger(__name__)
 
 _TRANSFORMERS_AVAILABLE = importlib.util.find_spec("transformers") is not None
+# Tokenizadores compartidos entre extractores del mismo modelo
+_TOKENIZER_CACHE: Dict[str, object] = {}
 
 # Patrones básicos de respaldo
 CIE_PATTERN = re.compile(r"\b([A-TV-Z][0-9]{2}(?:\.[0-9A-Z])?)\b")
 CUPS_PATTERN = re.compile(r"\b([0-9]{4,7}(?:-[0-9])?)\b")
+# CIE y CUPS en una sola alternancia: un único recorrido del texto (no se solapan)
+_COMBINED_RE = re.compile(r"\b(?:(?P<cie>[A-TV-Z][0-9]{2}(?:\.[0-9A-Z])?)|(?P<cups>[0-9]{4,7}(?:-[0-9])?))\b")
 PROCEDURE_KEYWORDS = [
     "procedimiento",
     "sutura",
@@ -29,6 +38,33 @@ PROCEDURE_KEYWORDS = [
     "terapia",
 ]
 
+try:
+    import ahocorasick  # pyahocorasick
+except ImportError:  # pragma: no cover - dependencia opcional
+    ahocorasick = None
+
+# Autómata compartido (se construye en el primer uso); sin pyahocorasick, una alternancia regex
+_PROCEDURE_AC = None
+_PROCEDURE_KEYWORDS_RE = re.compile("|".join(map(re.escape, PROCEDURE_KEYWORDS)))
+
+
+def _procedure_automaton():
+    global _PROCEDURE_AC
+    if _PROCEDURE_AC is None:
+        automaton = ahocorasick.Automaton()
+        for keyword in PROCEDURE_KEYWORDS:
+            automaton.add_word(keyword, keyword)
+        automaton.make_automaton()
+        _PROCEDURE_AC = automaton
+    return _PROCEDURE_AC
+
+
+def _has_procedure_keyword(lower_text: str) -> bool:
+    # Una sola pasada sobre el texto (ya en minúsculas) para todas las palabras clave
+    if ahocorasick is not None:
+        return next(_procedure_automaton().iter(lower_text), None) is not None
+    return _PROCEDURE_KEYWORDS_RE.search(lower_text) is not None
+
 
 @dataclass
 class TransformerConfig:
@@ -38,6 +74,8 @@ class TransformerConfig:
     aggregation_strategy: str = "simple"
     local_files_only: bool = False
     enabled: bool = True
+    # Precisión de inferencia en CPU: "int8" (cuantización dinámica), "bf16" o "fp32"
+    quantization: str = "int8"
 
 
 class ClinicalEntityExtractor:
@@ -45,50 +83,111 @@ class ClinicalEntityExtractor:
 
     def __init__(self, config: Optional[TransformerConfig] = None) -> None:
         self.config = config or TransformerConfig()
-        self.enabled = False
+        # El modelo se carga en la primera extracción (ver ``_ensure_pipeline``)
         self._pipeline = None
+        self._init_tried = False
+
+    @property
+    def enabled(self) -> bool:
+        """Indica si se usa el modelo transformers (lo inicializa si aún no se intentó)."""
+        self._ensure_pipeline()
+        return self._pipeline is not None
+
+    def _ensure_pipeline(self) -> None:
+        if self._pipeline is not None or self._init_tried:
+            return
+        self._init_tried = True
+        if not (self.config.enabled and _TRANSFORMERS_AVAILABLE):
+            return
+        try:
+            transformers = importlib.import_module("transformers")
+            AutoTokenizer = getattr(transformers, "AutoTokenizer")
+            AutoModelForTokenClassification = getattr(transformers, "AutoModelForTokenClassification")
+            pipeline_fn = getattr(transformers, "pipeline")
 
-        if self.config.enabled and _TRANSFORMERS_AVAILABLE:
-            try:
-                transformers = importlib.import_module("transformers")
-                AutoTokenizer = getattr(transformers, "AutoTokenizer")
-                AutoModelForTokenClassification = getattr(transformers, "AutoModelForTokenClassification")
-                pipeline_fn = getattr(transformers, "pipeline")
+            torch = importlib.import_module("torch")
+            on_gpu = torch.cuda.is_available()
 
+            tokenizer = _TOKENIZER_CACHE.get(self.config.model_name)
+            if tokenizer is None:
                 tokenizer = AutoTokenizer.from_pretrained(
                     self.config.model_name,
                     local_files_only=self.config.local_files_only,
+                    use_fast=True,
                 )
-                model = AutoModelForTokenClassification.from_pretrained(
-                    self.config.model_name,
-                    local_files_only=self.config.local_files_only,
-                )
-                self._pipeline = pipeline_fn(
-                    "token-classification",
-                    model=model,
-                    tokenizer=tokenizer,
-                    aggregation_strategy=self.config.aggregation_strategy,
-                )
-                self.enabled = True
-                LOGGER.info("Extractor NLP inicializado con modelo %s", self.config.model_name)
-            except Exception as exc:  # pragma: no cover - dependencias opcionales
-                LOGGER.warning(
-                    "No fue posible inicializar el modelo transformers (%s). "
-                    "Se usará el extractor heurístico.",
-                    exc,
-                )
+                _TOKENIZER_CACHE[self.config.model_name] = tokenizer
+            model = AutoModelForTokenClassification.from_pretrained(
+                self.config.model_name,
+                local_files_only=self.config.local_files_only,
+                torch_dtype=torch.float16 if on_gpu else torch.float32,
+            ).eval()
+            # Clasificación de tokens: no se necesitan past_key_values
+            model.config.use_cache = False
+            if not on_gpu:
+                # La cuantización dinámica solo aplica en CPU; en GPU ya se usa fp16
+                model = self._reduce_precision(model)
+            self._pipeline = pipeline_fn(
+                "token-classification",
+                model=model,
+                tokenizer=tokenizer,
+                aggregation_strategy=self.config.aggregation_strategy,
+                framework="pt",
+                device=0 if on_gpu else -1,
+            )
+            LOGGER.info("Extractor NLP inicializado con modelo %s", self.config.model_name)
+        except Exception as exc:  # pragma: no cover - dependencias opcionales
+            LOGGER.warning(
+                "No fue posible inicializar el modelo transformers (%s). "
+                "Se usará el extractor heurístico.",
+                exc,
+            )
 
     def extract(self, text: str) -> ClinicalExtractionResult:
-        if self.enabled and self._pipeline is not None:
+        if self.enabled:
             return self._extract_with_transformer(text)
         return self._extract_with_heuristics(text)
 
+    def extract_batch(self, texts: Sequence[str], batch_size: int = 8) -> List[ClinicalExtractionResult]:
+        """Extrae varias historias; con transformer, el pipeline agrupa ``batch_size`` textos por pasada."""
+        texts = list(texts)
+        if not texts:
+            return []
+        if self.enabled:
+            # Ordenar por longitud: cada minilote rellena (padding) hasta un largo parecido
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+            outputs = self._pipeline([texts[i] for i in order], batch_size=batch_size)
+            results: List[Optional[ClinicalExtractionResult]] = [None] * len(texts)
+            for i, entities in zip(order, outputs):
+                results[i] = self._entities_to_result(entities)
+            return results
+        return [self._extract_with_heuristics(text) for text in texts]
+
     # --------------------------------------------------------------------- #
     # Implementaciones
     # --------------------------------------------------------------------- #
+    def _reduce_precision(self, model):
+        """Aplica ``config.quantization``; si falla se conserva el modelo en fp32."""
+        mode = self.config.quantization
+        if mode == "fp32":
+            return model
+        try:
+            torch = importlib.import_module("torch")
+            if mode == "int8":
+                # Pesos de las capas lineales en int8; activaciones cuantizadas al vuelo
+                return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            if mode == "bf16":
+                return model.to(torch.bfloat16)
+            raise ValueError(f"Cuantización no soportada: {mode}")
+        except Exception as exc:  # pragma: no cover - depende del backend de torch
+            LOGGER.warning("No fue posible aplicar la cuantización %s (%s). Se usará fp32.", mode, exc)
+            return model
+
     def _extract_with_transformer(self, text: str) -> ClinicalExtractionResult:
         """Utiliza el modelo HuggingFace para identificar entidades."""
-        entities = self._pipeline(text)
+        return self._entities_to_result(self._pipeline(text))
+
+    def _entities_to_result(self, entities: Iterable[dict]) -> ClinicalExtractionResult:
+        """Clasifica las entidades del pipeline en diagnósticos y procedimientos."""
         diagnoses: List[ClinicalEntity] = []
         procedures: List[ClinicalEntity] = []
 
@@ -115,13 +214,28 @@ class ClinicalEntityExtractor:
         diagnoses: List[ClinicalEntity] = []
         procedures: List[ClinicalEntity] = []
 
-        for code in set(CIE_PATTERN.findall(text)):
-            diagnoses.append(ClinicalEntity(label="DIAG_HEURISTIC", text=code, code=code, score=None))
+        seen_cie = set()
+        # Cada ventana es un fragmento del texto: si el texto completo no tiene
+        # vocabulario de procedimientos, ninguna ventana lo tendrá.
+        lower_text = text.lower()
+        has_procedure_vocab = _has_procedure_keyword(lower_text)
+        # Las ventanas se recortan del texto ya en minúsculas, salvo que ``lower()``
+        # haya cambiado la longitud (p. ej. "İ") y los índices no coincidan.
+        aligned = len(lower_text) == len(text)
 
-        for match in CUPS_PATTERN.finditer(text):
-            code = match.group(1)
-            context_window = text[max(0, match.start() - 80) : match.end() + 80]
-            if self._looks_like_procedure(context_window):
+        for match in _COMBINED_RE.finditer(text):
+            code = match.group(match.lastgroup)
+            if match.lastgroup == "cie":
+                if code not in seen_cie:
+                    seen_cie.add(code)
+                    diagnoses.append(ClinicalEntity(label="DIAG_HEURISTIC", text=code, code=code, score=None))
+                continue
+            if not has_procedure_vocab:
+                continue
+            start, end = max(0, match.start() - 80), match.end() + 80
+            context_window = text[start:end]
+            lower_window = lower_text[start:end] if aligned else context_window.lower()
+            if _has_procedure_keyword(lower_window):
                 procedures.append(
                     ClinicalEntity(label="PROC_HEURISTIC", text=context_window.strip(), code=code, score=None)
                 )
@@ -140,5 +254,68 @@ class ClinicalEntityExtractor:
 
     @staticmethod
     def _looks_like_procedure(text: str) -> bool:
-        lower_text = text.lower()
-        return any(keyword in lower_text for keyword in PROCEDURE_KEYWORDS)
+        return _has_procedure_keyword(text.lower())
+
+
+class CachedExtractor:
+    """Envuelve un ``ClinicalEntityExtractor`` y guarda sus resultados en disco.
+
+    La clave combina el hash del texto con la huella de la configuración, de modo
+    que un cambio de modelo (o el paso a heurísticas) no reutiliza resultados viejos.
+    """
+
+    def __init__(self, extractor: ClinicalEntityExtractor, cache_dir: Path) -> None:
+        self.extractor = extractor
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Se usa lo que la configuración espera para no cargar el modelo al construir;
+        # si su carga falla, esos resultados heurísticos no se guardan (ver ``extract_batch``).
+        self._transformer_expected = extractor.config.enabled and _TRANSFORMERS_AVAILABLE
+        fingerprint = dict(asdict(extractor.config), transformer_active=self._transformer_expected)
+        self._config_key = json.dumps(fingerprint, sort_keys=True).encode("utf-8")
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16)
+        digest.update(self._config_key)
+        return digest.hexdigest()
+
+    def _cache_file(self, text: str) -> Path:
+        return self.cache_dir / f"{self._key(text)}.json"
+
+    @staticmethod
+    def _load(cache_file: Path) -> Optional[ClinicalExtractionResult]:
+        if not cache_file.exists():
+            return None
+        try:
+            cached = load_json_bytes(cache_file.read_bytes())
+            return ClinicalExtractionResult(
+                diagnoses=[ClinicalEntity(**ent) for ent in cached["diagnoses"]],
+                procedures=[ClinicalEntity(**ent) for ent in cached["procedures"]],
+            )
+        except (ValueError, KeyError, TypeError) as exc:
+            LOGGER.warning("Caché NLP ilegible en %s (%s); se recalcula.", cache_file, exc)
+            return None
+
+    @staticmethod
+    def _store(cache_file: Path, result: ClinicalExtractionResult) -> None:
+        # Escritura atómica: varios procesos pueden compartir el mismo directorio
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+        tmp_file.write_bytes(dump_json_line(asdict(result)))
+        tmp_file.replace(cache_file)
+
+    def extract(self, text: str) -> ClinicalExtractionResult:
+        return self.extract_batch([text])[0]
+
+    def extract_batch(self, texts: Sequence[str], batch_size: int = 8) -> List[ClinicalExtractionResult]:
+        """Devuelve los aciertos de caché y envía solo los textos faltantes al extractor."""
+        cache_files = [self._cache_file(text) for text in texts]
+        results = [self._load(cache_file) for cache_file in cache_files]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            computed = self.extractor.extract_batch([texts[i] for i in missing], batch_size=batch_size)
+            cacheable = self.extractor.enabled == self._transformer_expected
+            for i, result in zip(missing, computed):
+                if cacheable:
+                    self._store(cache_files[i], result)
+                results[i] = result
+        return results
@@ -2,13 +2,14 @@
 
 from __future__ import annotations
 
+import functools
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Pattern, Tuple, Union
 
-from .models import ConsultationInfo, PatientInfo
+from .models import ConsultationInfo, PatientInfo, intern_code
 from .pdf_utils import extract_pdf_text
 
 
@@ -16,29 +17,73 @@ DATE_FORMATS = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d-%m-%Y %H:%M:%S", "%d/
 JUST_DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d")
 DOCUMENT_TYPES = ("CC", "TI", "RC", "CE", "PA", "NUIP", "MS")
 
+# Camino rápido de fechas (dd/mm/aaaa [hh:mm[:ss]] y aaaa-mm-dd) sin pasar por strptime
+_DT_RE = re.compile(r"(\d{1,2})([/-])(\d{1,2})\2(\d{4})(?:\s+(\d{1,2}):(\d{1,2})(?::(\d{1,2}))?)?")
+_ISO_DATE_RE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+
+# Patrones compilados una sola vez al importar el módulo
+_IDENT_RE = re.compile(r"Identificación:\s*([A-Z]{1,4})\s*-?\s*([0-9A-Za-z-]+)")
+_DOC_TOP_RE = re.compile(r"\b(CC|TI|RC|CE|PA|NUIP|MS)\s*-?\s*([0-9A-Za-z-]{4,})\s*-\s*[A-Z]")
+_DOC_GEN_RE = re.compile(r"\b(CC|TI|RC|CE|PA|NUIP|MS)\s*-?\s*([0-9A-Za-z-]{4,})\b")
+_NAME_RE = re.compile(r"Nombre:\s*([A-ZÁÉÍÓÚÑ0-9 .,'?-]+)")
+# Línea que empieza con "<tipo> " y contiene " - ": el nombre va tras el primer " - "
+_DOC_TYPE_RE = re.compile(rf"(?=(?:{'|'.join(DOCUMENT_TYPES)}) ).*? - (.*)")
+_DXP_RE = re.compile(r"DXP:\s*([A-Z0-9]{3,6})")
+_SECTION_SPLIT_RE = re.compile(r"•\s*")
+_TIPO_CONSULTA_RE = re.compile(r"Tipo de Consulta:\s*\(([0-9A-Za-z]+)\)\s*([^\n]+)")
+_COD_NOMB_RE = re.compile(r"Cod:\s*([A-Z0-9]+)\s+Nomb:\s*(.+?)(?:\s+Cant:|\s+DXP:|\s+DXR:|\s+Descripción:)", re.DOTALL)
+
+# Usados con _first_match/_extract_datetime: sin distinguir mayúsculas
+_ATENCION_RE = re.compile(r"Atención:\s*([0-9A-Za-z-]+)", re.IGNORECASE)
+_FECHA_INGRESO_RE = re.compile(r"Fecha y Hora de Ingreso:\s*([0-9/: -]+)", re.IGNORECASE)
+_FECHA_CIERRE_RE = re.compile(r"Cierre Historia\s*Fecha y Hora:\s*([0-9/: -]+)", re.IGNORECASE)
+_SERVICIO_RE = re.compile(r"Servicio de ingreso:\s*([A-Za-zÁÉÍÓÚÑ/ ]+)", re.IGNORECASE)
+_FINALIDAD_RE = re.compile(r"Finalidad:\s*([A-Za-zÁÉÍÓÚÑ ]+)", re.IGNORECASE)
+_TRIAGE_RE = re.compile(r"Triage\s*(I{1,3}|IV|V)", re.IGNORECASE)
+_DX_LINE_RE1 = re.compile(r"DX DIAGNOSTICOS:\s*([A-ZÁÉÍÓÚÑ0-9 ,./-]+)", re.IGNORECASE)
+_DX_LINE_RE2 = re.compile(r"Diagn[oó]stico(?: Principal)?:\s*([A-ZÁÉÍÓÚÑ0-9 ,./-]+)", re.IGNORECASE)
+_FECHA_HORA_RE = re.compile(r"Fecha y Hora:\s*([0-9/: -]+)", re.IGNORECASE)
+_AUTORIZACION_RE = re.compile(r"Autorizaci[oó]n:\s*([A-Za-z0-9-]+)", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_pattern(pattern: str, flags: int = re.IGNORECASE) -> Pattern[str]:
+    return re.compile(pattern, flags)
+
+
+def _compiled(pattern: Union[str, Pattern[str]]) -> Pattern[str]:
+    """Acepta patrones ya compilados o cadenas (se compilan una vez por proceso, sin mayúsculas)."""
+    return pattern if isinstance(pattern, re.Pattern) else _compile_pattern(pattern)
+
 
 @dataclass
 class HistoryParser:
     """Extrae información clínica para construir registros RIPS desde un PDF."""
 
     path: Path
+    text: Optional[str] = field(default=None, repr=False)
+
+    @classmethod
+    def from_text(cls, path: Path, text: str) -> "HistoryParser":
+        """Crea el parser con el texto ya extraído del PDF (evita leerlo de nuevo)."""
+        return cls(path=path, text=text)
 
     def parse(self) -> PatientInfo:
-        raw_text = extract_pdf_text(self.path)
+        raw_text = self.text if self.text is not None else extract_pdf_text(self.path)
         lines = [line.strip() for line in raw_text.splitlines() if line.strip()]
         normalized_text = "\n".join(lines)
 
         document_type, document_number = self._extract_document_info(normalized_text)
         full_name = self._extract_full_name(lines, normalized_text)
 
-        admission_id = self._first_match(normalized_text, r"Atención:\s*([0-9A-Za-z-]+)")
-        admission_datetime = self._extract_datetime(normalized_text, r"Fecha y Hora de Ingreso:\s*([0-9/: -]+)")
-        discharge_datetime = self._extract_datetime(normalized_text, r"Cierre Historia\s*Fecha y Hora:\s*([0-9/: -]+)")
-        service_type = self._first_match(normalized_text, r"Servicio de ingreso:\s*([A-Za-zÁÉÍÓÚÑ/ ]+)")
+        admission_id = self._first_match(normalized_text, _ATENCION_RE)
+        admission_datetime = self._extract_datetime(normalized_text, _FECHA_INGRESO_RE)
+        discharge_datetime = self._extract_datetime(normalized_text, _FECHA_CIERRE_RE)
+        service_type = self._first_match(normalized_text, _SERVICIO_RE)
         entry_service = self._extract_entry_service(lines, service_type)
 
         diagnosis_code, diagnosis_text = self._extract_diagnosis(normalized_text)
-        service_purpose = self._first_match(normalized_text, r"Finalidad:\s*([A-Za-zÁÉÍÓÚÑ ]+)")
+        service_purpose = self._first_match(normalized_text, _FINALIDAD_RE)
 
         consultations = self._extract_consultations(normalized_text)
 
@@ -54,32 +99,31 @@ class HistoryParser:
             principal_diagnosis=diagnosis_text,
             principal_diagnosis_code=diagnosis_code,
             service_purpose=service_purpose,
-            triage_level=self._first_match(normalized_text, r"Triage\s*(I{1,3}|IV|V)"),
+            triage_level=self._first_match(normalized_text, _TRIAGE_RE),
             consultations=consultations,
         )
 
     def _extract_document_info(self, text: str) -> Tuple[Optional[str], Optional[str]]:
-        match = re.search(r"Identificación:\s*([A-Z]{1,4})\s*-?\s*([0-9A-Za-z-]+)", text)
+        match = _IDENT_RE.search(text)
         if match:
-            return match.group(1), match.group(2)
-        top_match = re.search(r"\b(CC|TI|RC|CE|PA|NUIP|MS)\s*-?\s*([0-9A-Za-z-]{4,})\s*-\s*[A-Z]", text)
+            return intern_code(match.group(1)), match.group(2)
+        top_match = _DOC_TOP_RE.search(text)
         if top_match:
-            return top_match.group(1), top_match.group(2)
-        generic = re.search(r"\b(CC|TI|RC|CE|PA|NUIP|MS)\s*-?\s*([0-9A-Za-z-]{4,})\b", text)
+            return intern_code(top_match.group(1)), top_match.group(2)
+        generic = _DOC_GEN_RE.search(text)
         if generic:
-            return generic.group(1), generic.group(2)
+            return intern_code(generic.group(1)), generic.group(2)
         return None, None
 
     @staticmethod
     def _extract_full_name(lines: List[str], text: str) -> Optional[str]:
-        match = re.search(r"Nombre:\s*([A-ZÁÉÍÓÚÑ0-9 .,'?-]+)", text)
+        match = _NAME_RE.search(text)
         if match:
             return match.group(1).strip()
         for line in lines:
-            for doc_type in DOCUMENT_TYPES:
-                marker = f"{doc_type} "
-                if line.startswith(marker) and " - " in line:
-                    return line.split(" - ", 1)[1].strip()
+            line_match = _DOC_TYPE_RE.match(line)
+            if line_match:
+                return line_match.group(1).strip()
         return None
 
     @staticmethod
@@ -93,12 +137,12 @@ class HistoryParser:
         return fallback
 
     def _extract_diagnosis(self, text: str) -> Tuple[Optional[str], Optional[str]]:
-        code_match = re.search(r"DXP:\s*([A-Z0-9]{3,6})", text)
-        diagnosis_code = code_match.group(1) if code_match else None
+        code_match = _DXP_RE.search(text)
+        diagnosis_code = intern_code(code_match.group(1)) if code_match else None
 
-        diag_line = self._first_match(text, r"DX DIAGNOSTICOS:\s*([A-ZÁÉÍÓÚÑ0-9 ,./-]+)")
+        diag_line = self._first_match(text, _DX_LINE_RE1)
         if not diag_line:
-            diag_line = self._first_match(text, r"Diagn[oó]stico(?: Principal)?:\s*([A-ZÁÉÍÓÚÑ0-9 ,./-]+)")
+            diag_line = self._first_match(text, _DX_LINE_RE2)
 
         return diagnosis_code, diag_line
 
@@ -106,17 +150,16 @@ class HistoryParser:
         consultations: List[ConsultationInfo] = []
         seen_keys = set()
 
-        sections = re.split(r"•\s*", text)
-        for raw_section in sections:
+        for raw_section in _iter_sections(text):
             section = raw_section.strip()
             if not section:
                 continue
-            section_datetime = self._extract_datetime(section, r"Fecha y Hora:\s*([0-9/: -]+)")
-            purpose_text = self._first_match(section, r"Finalidad:\s*([A-Za-zÁÉÍÓÚÑ ]+)")
-            authorization = self._first_match(section, r"Autorizaci[oó]n:\s*([A-Za-z0-9-]+)")
+            section_datetime = self._extract_datetime(section, _FECHA_HORA_RE)
+            purpose_text = self._first_match(section, _FINALIDAD_RE)
+            authorization = self._first_match(section, _AUTORIZACION_RE)
 
-            for match in re.finditer(r"Tipo de Consulta:\s*\(([0-9A-Za-z]+)\)\s*([^\n]+)", section):
-                code = match.group(1)
+            for match in _TIPO_CONSULTA_RE.finditer(section):
+                code = intern_code(match.group(1))
                 description = match.group(2).strip()
                 key = (code, section_datetime)
                 if key in seen_keys:
@@ -133,8 +176,8 @@ class HistoryParser:
                     )
                 )
 
-            for match in re.finditer(r"Cod:\s*([A-Z0-9]+)\s+Nomb:\s*(.+?)(?:\s+Cant:|\s+DXP:|\s+DXR:|\s+Descripción:)", section, flags=re.DOTALL):
-                code = match.group(1)
+            for match in _COD_NOMB_RE.finditer(section):
+                code = intern_code(match.group(1))
                 description = " ".join(match.group(2).split())
                 key = (code, section_datetime)
                 if key in seen_keys:
@@ -153,8 +196,8 @@ class HistoryParser:
         return consultations
 
     @staticmethod
-    def _first_match(text: str, pattern: str) -> Optional[str]:
-        match = re.search(pattern, text, flags=re.IGNORECASE)
+    def _first_match(text: str, pattern: Union[str, Pattern[str]]) -> Optional[str]:
+        match = _compiled(pattern).search(text)
         if not match:
             return None
         group_index = 1 if match.lastindex else 0
@@ -162,11 +205,15 @@ class HistoryParser:
         return value or None
 
     @staticmethod
-    def _extract_datetime(text: str, pattern: str) -> Optional[datetime]:
-        match = re.search(pattern, text, flags=re.IGNORECASE)
+    def _extract_datetime(text: str, pattern: Union[str, Pattern[str]]) -> Optional[datetime]:
+        match = _compiled(pattern).search(text)
         if not match:
             return None
         candidate = match.group(1).strip()
+        parsed = _fast_datetime(candidate)
+        if parsed is not None:
+            return parsed
+        # Formatos menos comunes (año de 2 dígitos, fecha seguida de texto, etc.)
         for fmt in DATE_FORMATS:
             try:
                 return datetime.strptime(candidate, fmt)
@@ -179,3 +226,32 @@ class HistoryParser:
             except ValueError:
                 continue
         return None
+
+
+def _iter_sections(text: str) -> Iterator[str]:
+    """Equivale a ``_SECTION_SPLIT_RE.split(text)`` pero entrega cada sección bajo demanda."""
+    start = 0
+    for separator in _SECTION_SPLIT_RE.finditer(text):
+        yield text[start : separator.start()]
+        start = separator.end()
+    yield text[start:]
+
+
+def _fast_datetime(candidate: str) -> Optional[datetime]:
+    """Interpreta los formatos habituales; ``None`` delega en los ``strptime`` de respaldo."""
+    match = _DT_RE.fullmatch(candidate)
+    if match:
+        day, sep, month, year, hour, minute, second = match.groups()
+        if sep == "-" and hour is not None and second is None:
+            return None  # "%d-%m-%Y %H:%M" no es un formato admitido
+        try:
+            return datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0))
+        except ValueError:
+            return None
+    match = _ISO_DATE_RE.fullmatch(candidate)
+    if match:
+        try:
+            return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        except ValueError:
+            return None
+    return None
@@ -9,7 +9,7 @@ from decimal import Decimal, InvalidOperation
 from pathlib import Path
 from typing import Iterable, List, Optional
 
-from .models import InvoiceData, InvoiceLine
+from .models import InvoiceData, InvoiceLine, intern_code
 from .pdf_utils import extract_pdf_tables, extract_pdf_text
 
 
@@ -128,7 +128,7 @@ class InvoiceParser:
                 first_cell = (row[0] or "").strip()
                 if not first_cell or first_cell.upper().startswith("SUBTOTAL"):
                     continue
-                code = (row[1] or "").strip() or None
+                code = intern_code((row[1] or "").strip() or None)
                 description = self._clean_description(row[2])
                 quantity = self._parse_decimal(row[5])
                 unit_amount = self._parse_decimal(row[6])
@@ -0,0 +1,53 @@
+"""Lectura/escritura JSON con orjson cuando está disponible (respaldo: json estándar)."""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, Dict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson es opcional
+    orjson = None
+
+
+def load_json_bytes(data: bytes) -> Any:
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def dump_json_bytes(obj: Any) -> bytes:
+    """Serializa con sangría de 2 espacios y UTF-8 sin escapar (como ``indent=2, ensure_ascii=False``)."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def dump_json_line(obj: Any) -> bytes:
+    """Serializa en una sola línea terminada en salto de línea (JSON Lines)."""
+    if orjson:
+        return orjson.dumps(obj) + b"\n"
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def write_json_stream(path: Path, obj: Dict[str, Any]) -> None:
+    """Escribe un objeto JSON clave por clave.
+
+    Los valores que son iteradores (p. ej. generadores) se vuelcan como arreglos
+    elemento a elemento, sin materializar la lista completa en memoria.
+    """
+    with Path(path).open("wb") as handle:
+        handle.write(b"{")
+        for index, (key, value) in enumerate(obj.items()):
+            handle.write((b"\n  " if index == 0 else b",\n  ") + dump_json_line(key)[:-1] + b": ")
+            if not isinstance(value, Iterator):
+                handle.write(dump_json_line(value)[:-1])
+                continue
+            handle.write(b"[")
+            empty = True
+            for item in value:
+                handle.write((b"\n    " if empty else b",\n    ") + dump_json_line(item)[:-1])
+                empty = False
+            handle.write(b"]" if empty else b"\n  ]")
+        handle.write(b"\n}\n")
@@ -2,13 +2,32 @@
 
 from __future__ import annotations
 
+import sys
 from dataclasses import dataclass, field
 from datetime import datetime
 from decimal import Decimal
 from typing import List, Optional
 
+# slots=True (sin __dict__ por instancia) solo existe desde Python 3.10
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+# Igual para kw_only: los modelos con muchos campos opcionales se construyen por nombre
+_KW_ONLY = {"kw_only": True} if sys.version_info >= (3, 10) else {}
 
-@dataclass
+# Códigos cortos muy repetidos (tipo de documento, CIE, CUPS, finalidad) se internan
+# al parsearlos para compartir un único objeto por valor. En CPython 3 lo internado se
+# libera cuando deja de tener referencias; el flag solo evita el costo de la tabla
+# de internado cuando los valores casi no se repiten.
+INTERN_CODES = True
+
+
+def intern_code(value: Optional[str]) -> Optional[str]:
+    """Devuelve la versión internada de ``value`` (si ``INTERN_CODES`` está activo)."""
+    if INTERN_CODES and type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+@dataclass(**_SLOTS, frozen=True)
 class InvoiceLine:
     """Información relevante de un ítem dentro de la factura electrónica."""
 
@@ -20,7 +39,7 @@ class InvoiceLine:
     line_extension_amount: Decimal
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class InvoiceData:
     """Información general de la factura electrónica."""
 
@@ -35,7 +54,7 @@ class InvoiceData:
     lines: List[InvoiceLine] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(**_SLOTS, **_KW_ONLY)
 class PatientInfo:
     """Datos extraídos de la historia clínica."""
 
@@ -56,7 +75,7 @@ class PatientInfo:
     consultations: List["ConsultationInfo"] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(**_SLOTS, frozen=True)
 class RipsProcedureRecord:
     """Registro RIPS de procedimientos (archivo AP)."""
 
@@ -77,7 +96,7 @@ class RipsProcedureRecord:
     modality_code: Optional[str]
 
 
-@dataclass
+@dataclass(**_SLOTS, frozen=True)
 class RipsInvoiceRecord:
     """Registro RIPS cabecera (archivo AF)."""
 
@@ -95,7 +114,7 @@ class RipsInvoiceRecord:
     discount_value: Decimal = Decimal("0")
 
 
-@dataclass
+@dataclass(**_SLOTS, frozen=True)
 class RipsUserRecord:
     """Registro RIPS de usuarios (archivo US)."""
 
@@ -113,7 +132,7 @@ class RipsUserRecord:
     residence_area: Optional[str]
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class AnnexPatientInfo:
     """Información complementaria obtenida de anexos (ej. JSON RIPS)."""
 
@@ -124,9 +143,14 @@ class AnnexPatientInfo:
     birth_date: Optional[datetime] = None
     municipality_code: Optional[str] = None
     residence_zone: Optional[str] = None
+    # Nombres ya separados cuando el anexo los trae por campo
+    first_name: Optional[str] = None
+    second_name: Optional[str] = None
+    last_name: Optional[str] = None
+    second_last_name: Optional[str] = None
 
 
-@dataclass
+@dataclass(**_SLOTS, frozen=True)
 class ConsultationInfo:
     """Información de consulta obtenida de la historia clínica."""
 
@@ -138,7 +162,7 @@ class ConsultationInfo:
     diagnosis_type: Optional[str] = None
 
 
-@dataclass
+@dataclass(**_SLOTS, frozen=True)
 class AnnexMedicationEntry:
     """Información de medicamentos extraída del anexo RIPS JSON."""
 
@@ -162,7 +186,7 @@ class AnnexMedicationEntry:
     concentration: Optional[str]
 
 
-@dataclass
+@dataclass(**_SLOTS, frozen=True)
 class AnnexOtherServiceEntry:
     """Información de otros servicios extraída del anexo RIPS JSON."""
 
@@ -182,7 +206,7 @@ class AnnexOtherServiceEntry:
     mipres_id: Optional[str]
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class AnnexData:
     """Contenedor general con información del anexo RIPS JSON."""
 
@@ -191,7 +215,7 @@ class AnnexData:
     other_services: List[AnnexOtherServiceEntry] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(**_SLOTS, frozen=True)
 class RipsConsultationRecord:
     """Registro RIPS de consultas (archivo AC)."""
 
@@ -214,7 +238,7 @@ class RipsConsultationRecord:
     net_value: Decimal
 
 
-@dataclass
+@dataclass(**_SLOTS, frozen=True)
 class RipsMedicationRecord:
     """Registro RIPS de medicamentos (archivo AM)."""
 
@@ -239,7 +263,7 @@ class RipsMedicationRecord:
     administration_date: Optional[datetime]
 
 
-@dataclass
+@dataclass(**_SLOTS, frozen=True)
 class RipsOtherServiceRecord:
     """Registro RIPS de otros servicios (archivo AT)."""
 
@@ -260,7 +284,7 @@ class RipsOtherServiceRecord:
     related_diagnosis: Optional[str]
 
 
-@dataclass
+@dataclass(**_SLOTS, frozen=True)
 class ValidationMessage:
     """Resultado de una regla de validación sobre los registros RIPS generados."""
 
@@ -269,7 +293,7 @@ class ValidationMessage:
     message: str
 
 
-@dataclass
+@dataclass(**_SLOTS, frozen=True)
 class ClinicalEntity:
     """Entidad clínica detectada en texto libre."""
 
@@ -279,7 +303,7 @@ class ClinicalEntity:
     score: Optional[float] = None
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class ClinicalExtractionResult:
     """Resultado del extractor NLP sobre una historia clínica."""
 
@@ -2,24 +2,174 @@
 
 from __future__ import annotations
 
+import hashlib
+import mmap
+import os
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Optional
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import pdfplumber
 
+try:
+    import pymupdf as fitz  # PyMuPDF: extracción en C, más rápida que pdfminer (opcional, ver PDF_BACKEND_ENV)
+except ImportError:  # pragma: no cover - dependencia opcional
+    try:
+        import fitz  # nombre del módulo en PyMuPDF < 1.24.3
+    except ImportError:
+        fitz = None
 
-def extract_pdf_text(path: Path) -> str:
-    """Devuelve el contenido textual del PDF concatenando todas las páginas."""
+
+@contextmanager
+def _mapped_pdf(pdf_path: Path) -> Iterator[Union[mmap.mmap, BinaryIO]]:
+    """Abre el PDF como mapa de memoria de solo lectura para pdfminer.
+
+    Las lecturas salen de la caché de páginas del sistema, compartida entre procesos
+    que abren el mismo archivo. Un archivo vacío no se puede mapear: se entrega tal cual.
+    """
+    with pdf_path.open("rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            yield handle
+            return
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+# pdfplumber es el motor por defecto: las reglas de HistoryParser/InvoiceParser están
+# ajustadas a su orden de lectura y saltos de línea. PyMuPDF (extra "fast") es opcional
+# y solo se usa si se pide; verificar antes con scripts/compare_pdf_backends.py.
+PDF_BACKEND_ENV = "RIPS_PDF_BACKEND"
+PDF_BACKENDS = ("pdfplumber", "pymupdf")
+
+
+def resolve_pdf_backend(backend: Optional[str] = None) -> str:
+    """Motor de extracción: ``backend`` explícito, luego ``RIPS_PDF_BACKEND``, luego pdfplumber."""
+    name = (backend or os.getenv(PDF_BACKEND_ENV) or "pdfplumber").strip().lower()
+    if name not in PDF_BACKENDS:
+        raise ValueError(f"Motor PDF desconocido: {name!r} (opciones: {', '.join(PDF_BACKENDS)})")
+    if name == "pymupdf" and fitz is None:
+        raise ImportError("PyMuPDF no está instalado; instala el extra 'fast' o usa pdfplumber")
+    return name
+
+
+def iter_pdf_pages(path: Path, backend: Optional[str] = None) -> Iterator[str]:
+    """Entrega el texto de cada página a medida que se lee (las siguientes no se procesan aún)."""
     pdf_path = Path(path)
     if not pdf_path.exists():
         raise FileNotFoundError(pdf_path)
 
-    texts: List[str] = []
-    with pdfplumber.open(pdf_path) as pdf:
+    if resolve_pdf_backend(backend) == "pymupdf":
+        doc = fitz.open(str(pdf_path))
+        try:
+            for page in doc:
+                yield page.get_text("text")
+        finally:
+            doc.close()
+        return
+
+    with _mapped_pdf(pdf_path) as stream, pdfplumber.open(stream) as pdf:
         for page in pdf.pages:
-            page_text = page.extract_text() or ""
-            texts.append(page_text)
-    return "\n".join(texts)
+            yield page.extract_text() or ""
+
+
+def extract_pdf_text(path: Path, backend: Optional[str] = None) -> str:
+    """Devuelve el contenido textual del PDF concatenando todas las páginas."""
+    pdf_path = Path(path)
+    if not pdf_path.exists():
+        raise FileNotFoundError(pdf_path)
+    return "\n".join(iter_pdf_pages(pdf_path, backend))
+
+
+# Caché en disco de texto extraído. La clave combina el SHA-256 del PDF, el motor y su
+# versión, y TEXT_CACHE_VERSION: cambiar el archivo, el motor o la forma de extraer
+# invalida la entrada.
+DEFAULT_CACHE_DIR = Path("~/.cache/rips").expanduser()
+# Subir al cambiar cómo se arma el texto (unión de páginas, limpieza, etc.)
+TEXT_CACHE_VERSION = 1
+
+
+def pdf_sha256(path: Path) -> str:
+    """Hash del contenido completo del PDF (clave de las cachés en disco)."""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def _backend_tag(name: str) -> str:
+    module = fitz if name == "pymupdf" else pdfplumber
+    return f"{name}-{getattr(module, '__version__', 'na')}"
+
+
+def extract_pdf_text_cached(path: Path, cache_dir: Path = DEFAULT_CACHE_DIR, backend: Optional[str] = None) -> str:
+    """Como ``extract_pdf_text``, pero reutiliza el texto guardado para el mismo contenido y motor."""
+    pdf_path = Path(path)
+    if not pdf_path.exists():
+        raise FileNotFoundError(pdf_path)
+    name = resolve_pdf_backend(backend)
+    cache_dir = Path(cache_dir)
+    cache_file = cache_dir / f"{pdf_sha256(pdf_path)}.{_backend_tag(name)}.v{TEXT_CACHE_VERSION}.txt"
+    if cache_file.exists():
+        return cache_file.read_text(encoding="utf-8")
+
+    text = extract_pdf_text(pdf_path, name)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Escritura atómica: varios procesos pueden compartir el mismo directorio
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(text, encoding="utf-8")
+    os.replace(tmp_file, cache_file)
+    return text
+
+
+_FINGERPRINT_BLOCK = 64 * 1024
+
+
+def pdf_fingerprint(path: Path) -> Tuple[int, bytes]:
+    """Huella barata del contenido: tamaño + blake2b de los primeros y últimos 64 KB."""
+    pdf_path = Path(path)
+    size = pdf_path.stat().st_size
+    digest = hashlib.blake2b(digest_size=16)
+    with pdf_path.open("rb") as handle:
+        digest.update(handle.read(_FINGERPRINT_BLOCK))
+        if size > 2 * _FINGERPRINT_BLOCK:
+            handle.seek(-_FINGERPRINT_BLOCK, 2)
+        # Archivos pequeños: el resto completo; grandes: solo el último bloque
+        digest.update(handle.read())
+    return size, digest.digest()
+
+
+def dedupe_pdfs(paths: Iterable[Path]) -> Iterator[Tuple[Path, Optional[Path]]]:
+    """Recorre los PDF una sola vez por ruta y marca los duplicados por contenido.
+
+    Entrega ``(ruta, canónica)``: ``canónica`` es ``None`` para la primera aparición
+    de un contenido y la ruta original para las copias. Las rutas repetidas (por
+    solapamiento entre directorios y globs) se omiten. ``pdf_fingerprint`` solo
+    filtra candidatos: en archivos grandes la copia se confirma con ``pdf_sha256``.
+    """
+    seen_paths: Set[Path] = set()
+    first_by_key: Dict[Tuple[int, bytes], Path] = {}
+    # Contenido completo -> ruta canónica; solo se calcula ante huellas coincidentes
+    canonical_by_hash: Dict[str, Path] = {}
+    hashed: Set[Path] = set()
+    for path in paths:
+        resolved = Path(path).resolve()
+        if resolved in seen_paths:
+            continue
+        seen_paths.add(resolved)
+        try:
+            key = pdf_fingerprint(path)
+            first = first_by_key.setdefault(key, path)
+            if first is path or key[0] <= 2 * _FINGERPRINT_BLOCK:
+                # Archivo pequeño: la huella ya cubre todo el contenido
+                canonical = first
+            else:
+                if first not in hashed:
+                    canonical_by_hash.setdefault(pdf_sha256(first), first)
+                    hashed.add(first)
+                canonical = canonical_by_hash.setdefault(pdf_sha256(path), path)
+                hashed.add(path)
+        except OSError:
+            # Archivo inaccesible: que el procesamiento posterior reporte el error
+            yield path, None
+            continue
+        yield path, (None if canonical is path else canonical)
 
 
 def extract_pdf_tables(path: Path) -> List[List[List[Optional[str]]]]:
@@ -29,7 +179,7 @@ def extract_pdf_tables(path: Path) -> List[List[List[Optional[str]]]]:
         raise FileNotFoundError(pdf_path)
 
     tables: List[List[List[Optional[str]]]] = []
-    with pdfplumber.open(pdf_path) as pdf:
+    with _mapped_pdf(pdf_path) as stream, pdfplumber.open(stream) as pdf:
         for page in pdf.pages:
             table = page.extract_table()
             if table:
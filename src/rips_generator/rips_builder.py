@@ -2,12 +2,14 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+import functools
+from dataclasses import dataclass, field
 from datetime import datetime
 from decimal import Decimal
-from typing import Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 
 from .models import (
+    _SLOTS,
     AnnexData,
     ConsultationInfo,
     InvoiceData,
@@ -22,6 +24,16 @@ from .models import (
 )
 
 
+# Los valores se cuantizan una vez a 2 decimales al construir cada registro (mismo
+# redondeo del contexto que usa el formato "{:.2f}"): el exportador solo hace str().
+_Q2 = Decimal("0.01")
+_ZERO_2DP = Decimal("0.00")
+
+
+def _to_2dp(value: Optional[Decimal]) -> Optional[Decimal]:
+    return None if value is None else value.quantize(_Q2)
+
+
 ATTENTION_TYPE_MAP = {
     "urgencias": "02",
     "consulta externa": "01",
@@ -44,9 +56,15 @@ SERVICE_PURPOSE_MAP = {
 }
 
 DOCUMENT_TYPE_DEFAULT = "CC"
+_SPACE_REMOVE = str.maketrans("", "", " \t\n\r")
 
 
-@dataclass
+def _derived(**kwargs):
+    """Atributo calculado en ``__post_init__``: fuera de ``__init__``, ``repr`` y ``==``."""
+    return field(init=False, repr=False, compare=False, **kwargs)
+
+
+@dataclass(**_SLOTS)
 class RipsBuilder:
     """Combina datos de factura e historia para producir registros RIPS."""
 
@@ -55,18 +73,39 @@ class RipsBuilder:
     provider_code: Optional[str] = None
     annex_data: Optional[AnnexData] = None
 
-    def build_procedure_records(self) -> List[RipsProcedureRecord]:
-        provider_code = self.provider_code or self.invoice.supplier_tax_id or ""
-        document_type = self.resolve_document_type()
-        document_number = self.resolve_document_number()
-
-        service_date = self._resolve_service_date()
-        attention_code = self._map_attention_type(self.patient.service_type)
-        purpose_code = self._map_service_purpose(self.patient.service_purpose)
+    _provider_code: str = _derived()
+    _doc_type: str = _derived()
+    _doc_number: str = _derived()
+    _service_date: datetime = _derived()
+    _attention_code: Optional[str] = _derived()
+    _purpose_code: Optional[str] = _derived()
+    _line_value_by_cups: Dict[str, Decimal] = _derived()
+
+    def __post_init__(self) -> None:
+        # Valores invariantes para todos los registros: se resuelven una sola vez
+        self._provider_code = self.provider_code or self.invoice.supplier_tax_id or ""
+        self._doc_type = self._compute_document_type()
+        self._doc_number = self._compute_document_number()
+        self._service_date = self._resolve_service_date()
+        self._attention_code = self._map_attention_type(self.patient.service_type)
+        self._purpose_code = self._map_service_purpose(self.patient.service_purpose)
+        # Valor por CUPS: se conserva la primera línea de la factura con cada código
+        self._line_value_by_cups = {}
+        for line in self.invoice.lines:
+            key = (line.cups_code or "").strip()
+            if key and key not in self._line_value_by_cups:
+                self._line_value_by_cups[key] = _to_2dp(line.line_extension_amount or line.price_amount) or _ZERO_2DP
+
+    def build_procedure_records(self) -> Iterator[RipsProcedureRecord]:
+        provider_code = self._provider_code
+        document_type = self._doc_type
+        document_number = self._doc_number
+        service_date = self._service_date
+        attention_code = self._attention_code
+        purpose_code = self._purpose_code
 
-        records: List[RipsProcedureRecord] = []
         for line in self.invoice.lines:
-            record = RipsProcedureRecord(
+            yield RipsProcedureRecord(
                 provider_code=provider_code,
                 invoice_number=self.invoice.invoice_id,
                 document_type=document_type,
@@ -79,140 +118,122 @@ class RipsBuilder:
                 diagnosis_related=None,
                 service_purpose_code=purpose_code,
                 attention_type_code=attention_code,
-                copayment_value=Decimal("0"),
-                net_value=line.line_extension_amount or line.price_amount,
+                copayment_value=_ZERO_2DP,
+                net_value=_to_2dp(line.line_extension_amount or line.price_amount),
                 modality_code=None,
             )
-            records.append(record)
-        return records
 
-    def build_consultation_records(self) -> List[RipsConsultationRecord]:
-        provider_code = self.provider_code or self.invoice.supplier_tax_id or ""
-        document_type = self.resolve_document_type()
-        document_number = self.resolve_document_number()
+    def build_consultation_records(self) -> Iterator[RipsConsultationRecord]:
+        provider_code = self._provider_code
+        document_type = self._doc_type
+        document_number = self._doc_number
         diagnosis_code = self.patient.principal_diagnosis_code
+        patient_purpose_code = self._purpose_code
 
-        records: List[RipsConsultationRecord] = []
         for consultation in self.patient.consultations or []:
-            consultation_datetime = consultation.datetime or self._resolve_service_date()
+            consultation_datetime = consultation.datetime or self._service_date
             consultation_code = consultation.code
-            purpose_text = consultation.purpose_text or self.patient.service_purpose
-            purpose_code = self._map_consultation_purpose(purpose_text)
+            # Sin finalidad propia se usa la del paciente, ya mapeada en __post_init__
+            purpose_text = consultation.purpose_text
+            purpose_code = self._map_consultation_purpose(purpose_text) if purpose_text else patient_purpose_code
             line_value = self._match_line_value(consultation_code)
 
-            records.append(
-                RipsConsultationRecord(
-                    provider_code=provider_code,
-                    invoice_number=self.invoice.invoice_id,
-                    document_type=document_type,
-                    document_number=document_number,
-                    consultation_date=consultation_datetime,
-                    authorization_number=consultation.authorization_number,
-                    consultation_code=consultation_code,
-                    consultation_purpose=purpose_code,
-                    external_cause=None,
-                    principal_diagnosis=diagnosis_code,
-                    related_diagnosis1=None,
-                    related_diagnosis2=None,
-                    related_diagnosis3=None,
-                    diagnosis_type=consultation.diagnosis_type or "1",
-                    consultation_value=line_value,
-                    copayment_value=Decimal("0"),
-                    net_value=line_value,
-                )
+            yield RipsConsultationRecord(
+                provider_code=provider_code,
+                invoice_number=self.invoice.invoice_id,
+                document_type=document_type,
+                document_number=document_number,
+                consultation_date=consultation_datetime,
+                authorization_number=consultation.authorization_number,
+                consultation_code=consultation_code,
+                consultation_purpose=purpose_code,
+                external_cause=None,
+                principal_diagnosis=diagnosis_code,
+                related_diagnosis1=None,
+                related_diagnosis2=None,
+                related_diagnosis3=None,
+                diagnosis_type=consultation.diagnosis_type or "1",
+                consultation_value=line_value,
+                copayment_value=_ZERO_2DP,
+                net_value=line_value,
             )
-        return records
 
-    def build_medication_records(self) -> List[RipsMedicationRecord]:
+    def build_medication_records(self) -> Iterator[RipsMedicationRecord]:
         if not self.annex_data:
-            return []
+            return
 
-        provider_code = self.provider_code or self.invoice.supplier_tax_id or ""
-        document_type = self.resolve_document_type()
-        document_number = self.resolve_document_number()
+        provider_code = self._provider_code
+        document_type = self._doc_type
+        document_number = self._doc_number
 
-        records: List[RipsMedicationRecord] = []
         for med in self.annex_data.medications:
-            entry_document_type = med.document_type or document_type
-            entry_document_number = med.document_number or document_number
-            if entry_document_number and document_number and entry_document_number != document_number:
-                entry_document_number = document_number
-            if entry_document_type and document_type and entry_document_type != document_type:
-                entry_document_type = document_type
-
-            records.append(
-                RipsMedicationRecord(
-                    provider_code=med.provider_code or provider_code,
-                    invoice_number=self.invoice.invoice_id,
-                    document_type=entry_document_type,
-                    document_number=entry_document_number,
-                    authorization_number=med.authorization_number,
-                    medication_code=med.medication_code,
-                    medication_name=med.medication_name,
-                    medication_type=med.medication_type,
-                    pharmaceutical_form=med.pharmaceutical_form,
-                    concentration=med.concentration,
-                    unit_measure=med.unit_measure,
-                    treatment_days=med.treatment_days,
-                    quantity=med.quantity,
-                    unit_value=med.unit_value,
-                    total_value=med.total_value,
-                    mipres_id=med.mipres_id,
-                    principal_diagnosis=med.diagnosis_code or self.patient.principal_diagnosis_code,
-                    related_diagnosis=med.related_diagnosis,
-                    administration_date=med.administration_date,
-                )
+            # El documento resuelto del paciente prevalece sobre el del anexo
+            entry_document_number = document_number or med.document_number or ""
+            entry_document_type = document_type or med.document_type or DOCUMENT_TYPE_DEFAULT
+
+            yield RipsMedicationRecord(
+                provider_code=med.provider_code or provider_code,
+                invoice_number=self.invoice.invoice_id,
+                document_type=entry_document_type,
+                document_number=entry_document_number,
+                authorization_number=med.authorization_number,
+                medication_code=med.medication_code,
+                medication_name=med.medication_name,
+                medication_type=med.medication_type,
+                pharmaceutical_form=med.pharmaceutical_form,
+                concentration=med.concentration,
+                unit_measure=med.unit_measure,
+                treatment_days=med.treatment_days,
+                quantity=_to_2dp(med.quantity),
+                unit_value=_to_2dp(med.unit_value),
+                total_value=_to_2dp(med.total_value),
+                mipres_id=med.mipres_id,
+                principal_diagnosis=med.diagnosis_code or self.patient.principal_diagnosis_code,
+                related_diagnosis=med.related_diagnosis,
+                administration_date=med.administration_date,
             )
-        return records
 
-    def build_other_service_records(self) -> List[RipsOtherServiceRecord]:
+    def build_other_service_records(self) -> Iterator[RipsOtherServiceRecord]:
         if not self.annex_data:
-            return []
+            return
 
-        provider_code = self.provider_code or self.invoice.supplier_tax_id or ""
-        document_type = self.resolve_document_type()
-        document_number = self.resolve_document_number()
+        provider_code = self._provider_code
+        document_type = self._doc_type
+        document_number = self._doc_number
 
-        records: List[RipsOtherServiceRecord] = []
         for other in self.annex_data.other_services:
-            entry_document_type = other.document_type or document_type
-            entry_document_number = other.document_number or document_number
-            if entry_document_number and document_number and entry_document_number != document_number:
-                entry_document_number = document_number
-            if entry_document_type and document_type and entry_document_type != document_type:
-                entry_document_type = document_type
-
-            records.append(
-                RipsOtherServiceRecord(
-                    provider_code=other.provider_code or provider_code,
-                    invoice_number=self.invoice.invoice_id,
-                    document_type=entry_document_type,
-                    document_number=entry_document_number,
-                    authorization_number=other.authorization_number,
-                    service_code=other.service_code,
-                    service_name=other.service_name,
-                    service_type=other.service_type,
-                    service_date=other.service_date,
-                    quantity=other.quantity,
-                    unit_value=other.unit_value,
-                    total_value=other.total_value,
-                    mipres_id=other.mipres_id,
-                    principal_diagnosis=other.diagnosis_code or self.patient.principal_diagnosis_code,
-                    related_diagnosis=other.related_diagnosis,
-                )
+            # El documento resuelto del paciente prevalece sobre el del anexo
+            entry_document_number = document_number or other.document_number or ""
+            entry_document_type = document_type or other.document_type or DOCUMENT_TYPE_DEFAULT
+
+            yield RipsOtherServiceRecord(
+                provider_code=other.provider_code or provider_code,
+                invoice_number=self.invoice.invoice_id,
+                document_type=entry_document_type,
+                document_number=entry_document_number,
+                authorization_number=other.authorization_number,
+                service_code=other.service_code,
+                service_name=other.service_name,
+                service_type=other.service_type,
+                service_date=other.service_date,
+                quantity=_to_2dp(other.quantity),
+                unit_value=_to_2dp(other.unit_value),
+                total_value=_to_2dp(other.total_value),
+                mipres_id=other.mipres_id,
+                principal_diagnosis=other.diagnosis_code or self.patient.principal_diagnosis_code,
+                related_diagnosis=other.related_diagnosis,
             )
-        return records
 
     def build_invoice_record(self) -> RipsInvoiceRecord:
-        provider_code = self.provider_code or self.invoice.supplier_tax_id or ""
-        document_type = self.resolve_document_type()
-        document_number = self.resolve_document_number()
+        provider_code = self._provider_code
+        document_type = self._doc_type
+        document_number = self._doc_number
         return RipsInvoiceRecord(
             provider_code=provider_code,
             provider_name=self.invoice.supplier_name,
             invoice_number=self.invoice.invoice_id,
             invoice_date=self.invoice.issue_date,
-            total_value=self.invoice.total_amount,
+            total_value=_to_2dp(self.invoice.total_amount),
             document_type=document_type,
             document_number=document_number,
             contract_number=None,
@@ -220,13 +241,12 @@ class RipsBuilder:
         )
 
     def build_user_record(self) -> Optional[RipsUserRecord]:
-        document_number = self.resolve_document_number()
+        document_number = self._doc_number
         if not document_number:
             return None
 
-        document_type = self.resolve_document_type()
-        full_name = self._resolve_full_name()
-        first_last, second_last, first_name, second_name = self._split_names(full_name)
+        document_type = self._doc_type
+        first_last, second_last, first_name, second_name = self._resolve_name_parts()
 
         gender = None
         age = None
@@ -239,8 +259,7 @@ class RipsBuilder:
             patient_info = self.annex_data.patient
             gender = (patient_info.gender or "").upper() or None
             if patient_info.birth_date:
-                service_date = self._resolve_service_date()
-                age = self._calculate_age(patient_info.birth_date, service_date)
+                age = self._calculate_age(patient_info.birth_date, self._service_date)
                 age_unit = "A" if age is not None else None
             municipality_code = patient_info.municipality_code
             if municipality_code:
@@ -263,9 +282,12 @@ class RipsBuilder:
         )
 
     def resolve_document_type(self) -> str:
-        cached = getattr(self, "_resolved_document_type", None)
-        if cached:
-            return cached
+        return self._doc_type
+
+    def resolve_document_number(self) -> str:
+        return self._doc_number
+
+    def _compute_document_type(self) -> str:
         candidates = [
             self.patient.document_type,
             self.patient.admission_document_type,
@@ -274,16 +296,10 @@ class RipsBuilder:
         ]
         for candidate in candidates:
             if candidate:
-                result = candidate.upper()
-                self._resolved_document_type = result
-                return result
-        self._resolved_document_type = DOCUMENT_TYPE_DEFAULT
+                return candidate.upper()
         return DOCUMENT_TYPE_DEFAULT
 
-    def resolve_document_number(self) -> str:
-        cached = getattr(self, "_resolved_document_number", None)
-        if cached is not None:
-            return cached
+    def _compute_document_number(self) -> str:
         candidates = [
             self.patient.document_number,
             self.patient.admission_document_number,
@@ -291,12 +307,23 @@ class RipsBuilder:
         ]
         for candidate in candidates:
             if candidate:
-                result = candidate.replace(" ", "")
-                self._resolved_document_number = result
-                return result
-        self._resolved_document_number = ""
+                return candidate.translate(_SPACE_REMOVE)
         return ""
 
+    def _resolve_name_parts(self) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]:
+        # Misma prioridad que el nombre completo: historia clínica y luego anexo.
+        # Si el anexo trae los nombres por campo se usan sin tokenizar.
+        if not self.patient.full_name and self.annex_data:
+            annex_patient = self.annex_data.patient
+            if annex_patient.first_name or annex_patient.last_name:
+                return (
+                    annex_patient.last_name,
+                    annex_patient.second_last_name,
+                    annex_patient.first_name,
+                    annex_patient.second_name,
+                )
+        return self._split_names(self._resolve_full_name())
+
     def _resolve_full_name(self) -> Optional[str]:
         if self.patient.full_name:
             return self.patient.full_name
@@ -309,7 +336,11 @@ class RipsBuilder:
             return self.patient.admission_datetime
         return self.invoice.issue_date
 
+    # Los valores se repiten en cada línea y consulta: se memoriza por texto.
+    # El orden del diccionario define la prioridad ("urgencias" antes que "consulta"),
+    # por eso se conserva el recorrido en lugar de una alternancia regex.
     @staticmethod
+    @functools.lru_cache(maxsize=512)
     def _map_attention_type(raw: Optional[str]) -> Optional[str]:
         if not raw:
             return None
@@ -320,6 +351,7 @@ class RipsBuilder:
         return None
 
     @staticmethod
+    @functools.lru_cache(maxsize=512)
     def _map_service_purpose(raw: Optional[str]) -> Optional[str]:
         if not raw:
             return None
@@ -337,7 +369,7 @@ class RipsBuilder:
     def _split_names(full_name: Optional[str]) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]:
         if not full_name:
             return None, None, None, None
-        tokens = [tok for tok in full_name.replace("  ", " ").strip().split(" ") if tok]
+        tokens = full_name.split()
         if len(tokens) == 1:
             return None, None, tokens[0], None
         if len(tokens) == 2:
@@ -362,8 +394,5 @@ class RipsBuilder:
 
     def _match_line_value(self, cups_code: Optional[str]) -> Decimal:
         if not cups_code:
-            return Decimal("0")
-        for line in self.invoice.lines:
-            if (line.cups_code or "").strip() == cups_code:
-                return line.line_extension_amount or line.price_amount or Decimal("0")
-        return Decimal("0")
+            return _ZERO_2DP
+        return self._line_value_by_cups.get(cups_code, _ZERO_2DP)
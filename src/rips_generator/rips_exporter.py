@@ -2,10 +2,13 @@
 
 from __future__ import annotations
 
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from decimal import Decimal
+from itertools import chain
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Any, Callable, Iterable, Iterator, Tuple
 
 from .models import (
     RipsConsultationRecord,
@@ -27,152 +30,193 @@ def write_rips_files(
     at_records: Iterable[RipsOtherServiceRecord] = (),
     delimiter: str = ",",
 ) -> None:
+    """Escribe los archivos planos; cada iterable se consume una sola vez (admite generadores)."""
     output_dir.mkdir(parents=True, exist_ok=True)
-    _write_file(output_dir / "AF.txt", [r for r in af_records], _af_row, delimiter)
-    _write_file(output_dir / "US.txt", [r for r in us_records if r is not None], _us_row, delimiter)
-    _write_file(output_dir / "AP.txt", [r for r in ap_records], _ap_row, delimiter)
-    _write_file(output_dir / "AC.txt", [r for r in ac_records], _ac_row, delimiter)
-    _write_file(output_dir / "AM.txt", [r for r in am_records], _am_row, delimiter)
-    _write_file(output_dir / "AT.txt", [r for r in at_records], _at_row, delimiter)
+    outputs = (
+        ("AF.txt", af_records, AF_COLUMNS),
+        ("US.txt", (r for r in us_records if r is not None), US_COLUMNS),
+        ("AP.txt", ap_records, AP_COLUMNS),
+        ("AC.txt", ac_records, AC_COLUMNS),
+        ("AM.txt", am_records, AM_COLUMNS),
+        ("AT.txt", at_records, AT_COLUMNS),
+    )
+    # Cada archivo es independiente y la escritura libera el GIL: se solapa la E/S.
+    # Cada iterable se consume una sola vez y solo desde su hilo: sin listas intermedias.
+    with ThreadPoolExecutor(max_workers=len(outputs)) as executor:
+        futures = [
+            executor.submit(_write_file, output_dir / name, records, columns, delimiter)
+            for name, records, columns in outputs
+        ]
+        for future in futures:
+            future.result()
+
+
+_WRITE_BUFFER = 1 << 20
+_EMPTY = object()
+
+Columns = Tuple[Tuple[str, Callable[[Any], str]], ...]
+
+
+def _write_file(path: Path, records: Iterable, columns: Columns, delimiter: str) -> None:
+    """Escribe una línea por registro directamente al archivo (sin armar todo el contenido)."""
+    records = iter(records)
+    first = next(records, _EMPTY)
+    if first is _EMPTY:
+        return
+    with path.open("w", encoding="utf-8", buffering=_WRITE_BUFFER) as handle:
+        handle.writelines(_row_lines(chain((first,), records), columns, delimiter))
 
 
-def _write_file(path: Path, records: List, formatter, delimiter: str) -> None:
-    if not records:
-        return
-    lines = []
+def _row_lines(records: Iterable, columns: Columns, delimiter: str) -> Iterator[str]:
+    # Unión simple con el separador (sin comillas CSV): es el formato plano RIPS esperado
+    format_row = _row_formatter(columns)
     for record in records:
-        row = formatter(record)
-        row = ["" if value is None else _format_value(value) for value in row]
-        lines.append(delimiter.join(row))
-    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
-
-
-def _af_row(record: RipsInvoiceRecord) -> List[Optional[str]]:
-    return [
-        record.provider_code,
-        record.invoice_number,
-        record.invoice_date.strftime("%Y-%m-%d"),
-        _format_decimal(record.total_value),
-        record.document_type,
-        record.document_number,
-        record.contract_number,
-        record.policy_number,
-        _format_decimal(record.copayment_value),
-        _format_decimal(record.commission_value),
-        _format_decimal(record.discount_value),
-    ]
-
-
-def _us_row(record: RipsUserRecord) -> List[Optional[str]]:
-    return [
-        record.document_type,
-        record.document_number,
-        record.last_name,
-        record.second_last_name,
-        record.first_name,
-        record.second_name,
-        str(record.age) if record.age is not None else None,
-        record.age_unit,
-        record.gender,
-        record.department_code,
-        record.municipality_code,
-        record.residence_area,
-    ]
-
-
-def _ap_row(record: RipsProcedureRecord) -> List[Optional[str]]:
-    return [
-        record.provider_code,
-        record.invoice_number,
-        record.document_type,
-        record.document_number,
-        record.service_date.strftime("%Y-%m-%d"),
-        record.authorization_number,
-        record.service_code,
-        record.cups_code,
-        record.diagnosis_code,
-        record.diagnosis_related,
-        record.service_purpose_code,
-        record.attention_type_code,
-        _format_decimal(record.copayment_value),
-        _format_decimal(record.net_value),
-        record.modality_code,
-    ]
-
-
-def _ac_row(record: RipsConsultationRecord) -> List[Optional[str]]:
-    return [
-        record.provider_code,
-        record.invoice_number,
-        record.document_type,
-        record.document_number,
-        record.consultation_date.strftime("%Y-%m-%d"),
-        record.authorization_number,
-        record.consultation_code,
-        record.consultation_purpose,
-        record.external_cause,
-        record.principal_diagnosis,
-        record.related_diagnosis1,
-        record.related_diagnosis2,
-        record.related_diagnosis3,
-        record.diagnosis_type,
-        _format_decimal(record.consultation_value),
-        _format_decimal(record.copayment_value),
-        _format_decimal(record.net_value),
-    ]
-
-
-def _am_row(record: RipsMedicationRecord) -> List[Optional[str]]:
-    return [
-        record.provider_code,
-        record.invoice_number,
-        record.document_type,
-        record.document_number,
-        record.authorization_number,
-        record.medication_code,
-        record.mipres_id,
-        record.medication_type,
-        record.medication_name,
-        record.pharmaceutical_form,
-        record.concentration,
-        record.unit_measure,
-        str(record.treatment_days) if record.treatment_days is not None else None,
-        _format_decimal(record.quantity),
-        _format_decimal(record.unit_value),
-        _format_decimal(record.total_value),
-        record.principal_diagnosis,
-        record.related_diagnosis,
-        record.administration_date.strftime("%Y-%m-%d") if record.administration_date else None,
-    ]
-
-
-def _at_row(record: RipsOtherServiceRecord) -> List[Optional[str]]:
-    return [
-        record.provider_code,
-        record.invoice_number,
-        record.document_type,
-        record.document_number,
-        record.authorization_number,
-        record.service_type,
-        record.service_code,
-        record.service_name,
-        record.service_date.strftime("%Y-%m-%d") if record.service_date else None,
-        _format_decimal(record.quantity),
-        _format_decimal(record.unit_value),
-        _format_decimal(record.total_value),
-        record.mipres_id,
-        record.principal_diagnosis,
-        record.related_diagnosis,
-    ]
-
-
-def _format_value(value) -> str:
-    if isinstance(value, Decimal):
-        return _format_decimal(value)
-    if isinstance(value, datetime):
-        return value.isoformat()
-    return str(value)
+        yield format_row(record, delimiter)
+
+
+@functools.lru_cache(maxsize=None)
+def _row_formatter(columns: Columns) -> Callable[[Any, str], str]:
+    """Genera (una vez por esquema) una función en línea recta que formatea una fila.
+
+    Los nombres de campo y formateadores quedan fijos en el bytecode: sin iterar
+    columnas ni buscar atributos por nombre en cada celda.
+    """
+    namespace = {f"_f{index}": fmt for index, (_, fmt) in enumerate(columns)}
+    lines = ["def _format_row(r, delimiter):"]
+    lines.extend(f"    v{index} = r.{name}" for index, (name, _) in enumerate(columns))
+    cells = ", ".join(f'"" if v{index} is None else _f{index}(v{index})' for index in range(len(columns)))
+    # Tupla en lugar de lista: una asignación más barata por fila
+    lines.append(f"    return delimiter.join(({cells})) + \"\\n\"")
+    exec("\n".join(lines), namespace)
+    return namespace["_format_row"]
+
+
+# Formateador fijo por columna: sin despacho por tipo en cada celda
+_str = str
+_format_2dp = "{:.2f}".format
+_ZERO_STR = "0.00"
 
 
 def _format_decimal(value: Decimal) -> str:
-    return f"{value:.2f}"
+    # Copagos, comisiones y descuentos suelen ser cero; el cero negativo conserva "-0.00"
+    if not value and not value.is_signed():
+        return _ZERO_STR
+    # El constructor ya cuantiza a 2 decimales: str() basta si la escala coincide
+    text = _str(value)
+    if text[-3:-2] == ".":
+        return text
+    return _format_2dp(value)
+
+
+# Las fechas se repiten entre registros de una misma factura: un strftime por fecha distinta
+@functools.lru_cache(maxsize=4096)
+def _date_ymd(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d")
+
+
+AF_COLUMNS: Columns = (
+    ("provider_code", _str),
+    ("invoice_number", _str),
+    ("invoice_date", _date_ymd),
+    ("total_value", _format_decimal),
+    ("document_type", _str),
+    ("document_number", _str),
+    ("contract_number", _str),
+    ("policy_number", _str),
+    ("copayment_value", _format_decimal),
+    ("commission_value", _format_decimal),
+    ("discount_value", _format_decimal),
+)
+
+US_COLUMNS: Columns = (
+    ("document_type", _str),
+    ("document_number", _str),
+    ("last_name", _str),
+    ("second_last_name", _str),
+    ("first_name", _str),
+    ("second_name", _str),
+    ("age", _str),
+    ("age_unit", _str),
+    ("gender", _str),
+    ("department_code", _str),
+    ("municipality_code", _str),
+    ("residence_area", _str),
+)
+
+AP_COLUMNS: Columns = (
+    ("provider_code", _str),
+    ("invoice_number", _str),
+    ("document_type", _str),
+    ("document_number", _str),
+    ("service_date", _date_ymd),
+    ("authorization_number", _str),
+    ("service_code", _str),
+    ("cups_code", _str),
+    ("diagnosis_code", _str),
+    ("diagnosis_related", _str),
+    ("service_purpose_code", _str),
+    ("attention_type_code", _str),
+    ("copayment_value", _format_decimal),
+    ("net_value", _format_decimal),
+    ("modality_code", _str),
+)
+
+AC_COLUMNS: Columns = (
+    ("provider_code", _str),
+    ("invoice_number", _str),
+    ("document_type", _str),
+    ("document_number", _str),
+    ("consultation_date", _date_ymd),
+    ("authorization_number", _str),
+    ("consultation_code", _str),
+    ("consultation_purpose", _str),
+    ("external_cause", _str),
+    ("principal_diagnosis", _str),
+    ("related_diagnosis1", _str),
+    ("related_diagnosis2", _str),
+    ("related_diagnosis3", _str),
+    ("diagnosis_type", _str),
+    ("consultation_value", _format_decimal),
+    ("copayment_value", _format_decimal),
+    ("net_value", _format_decimal),
+)
+
+AM_COLUMNS: Columns = (
+    ("provider_code", _str),
+    ("invoice_number", _str),
+    ("document_type", _str),
+    ("document_number", _str),
+    ("authorization_number", _str),
+    ("medication_code", _str),
+    ("mipres_id", _str),
+    ("medication_type", _str),
+    ("medication_name", _str),
+    ("pharmaceutical_form", _str),
+    ("concentration", _str),
+    ("unit_measure", _str),
+    ("treatment_days", _str),
+    ("quantity", _format_decimal),
+    ("unit_value", _format_decimal),
+    ("total_value", _format_decimal),
+    ("principal_diagnosis", _str),
+    ("related_diagnosis", _str),
+    ("administration_date", _date_ymd),
+)
+
+AT_COLUMNS: Columns = (
+    ("provider_code", _str),
+    ("invoice_number", _str),
+    ("document_type", _str),
+    ("document_number", _str),
+    ("authorization_number", _str),
+    ("service_type", _str),
+    ("service_code", _str),
+    ("service_name", _str),
+    ("service_date", _date_ymd),
+    ("quantity", _format_decimal),
+    ("unit_value", _format_decimal),
+    ("total_value", _format_decimal),
+    ("mipres_id", _str),
+    ("principal_diagnosis", _str),
+    ("related_diagnosis", _str),
+)
@@ -4,7 +4,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from decimal import Decimal
-from typing import Iterable, List, Optional
+from typing import List, Optional, Sequence
 
 from .models import (
     RipsConsultationRecord,
@@ -23,11 +23,12 @@ TOLERANCE = Decimal("1.00")  # tolerancia en pesos
 def validate_rips(
     invoice: RipsInvoiceRecord,
     user: Optional[RipsUserRecord],
-    procedures: Iterable[RipsProcedureRecord],
-    consultations: Iterable[RipsConsultationRecord],
-    medications: Iterable[RipsMedicationRecord],
-    other_services: Iterable[RipsOtherServiceRecord],
+    procedures: Sequence[RipsProcedureRecord],
+    consultations: Sequence[RipsConsultationRecord],
+    medications: Sequence[RipsMedicationRecord],
+    other_services: Sequence[RipsOtherServiceRecord],
 ) -> List[ValidationMessage]:
+    """Valida los registros en una sola pasada por tipo (documento, totales, diagnóstico y CUPS)."""
     messages: List[ValidationMessage] = []
 
     target_doc_type = invoice.document_type
@@ -36,53 +37,43 @@ def validate_rips(
         target_doc_type = user.document_type or target_doc_type
         target_doc_number = user.document_number or target_doc_number
 
-    _validate_documents(
-        target_doc_type,
-        target_doc_number,
-        procedures,
-        consultations,
-        medications,
-        other_services,
-        messages,
-    )
-    _validate_totals(invoice, procedures, consultations, medications, other_services, messages)
-    _validate_diagnoses(procedures, consultations, medications, other_services, messages)
-    _validate_cups(procedures, messages)
-
-    if not messages:
-        messages.append(ValidationMessage("INFO", "VAL000", "Registros validados sin inconsistencias detectadas."))
+    mismatches: List[str] = []
+    missing_dx: List[str] = []
+    missing_cups: List[str] = []
 
-    return messages
+    total_procedures = DECIMAL_ZERO
+    for idx, record in enumerate(procedures, start=1):
+        _check_doc("AP", record.document_type, record.document_number, target_doc_type, target_doc_number, mismatches)
+        if record.net_value is not None:
+            total_procedures += record.net_value
+        if not record.diagnosis_code:
+            missing_dx.append(f"AP[{idx}] sin diagnóstico principal")
+        if not record.cups_code:
+            missing_cups.append(str(idx))
 
+    total_consultations = DECIMAL_ZERO
+    for idx, record in enumerate(consultations, start=1):
+        _check_doc("AC", record.document_type, record.document_number, target_doc_type, target_doc_number, mismatches)
+        if record.net_value is not None:
+            total_consultations += record.net_value
+        if not record.principal_diagnosis:
+            missing_dx.append(f"AC[{idx}] sin diagnóstico principal")
 
-def _validate_documents(
-    target_doc_type: Optional[str],
-    target_doc_number: Optional[str],
-    procedures: Iterable[RipsProcedureRecord],
-    consultations: Iterable[RipsConsultationRecord],
-    medications: Iterable[RipsMedicationRecord],
-    other_services: Iterable[RipsOtherServiceRecord],
-    messages: List[ValidationMessage],
-) -> None:
-    mismatches: List[str] = []
+    total_medications = DECIMAL_ZERO
+    for idx, record in enumerate(medications, start=1):
+        _check_doc("AM", record.document_type, record.document_number, target_doc_type, target_doc_number, mismatches)
+        if record.total_value is not None:
+            total_medications += record.total_value
+        if not record.principal_diagnosis:
+            missing_dx.append(f"AM[{idx}] sin diagnóstico principal")
 
-    def check(record_type: str, doc_type: Optional[str], doc_number: Optional[str]) -> None:
-        if not doc_number:
-            mismatches.append(f"{record_type}: documento vacío")
-            return
-        if target_doc_number and doc_number != target_doc_number:
-            mismatches.append(f"{record_type}: documento {doc_number} != {target_doc_number}")
-        if target_doc_type and doc_type and doc_type != target_doc_type:
-            mismatches.append(f"{record_type}: tipo {doc_type} != {target_doc_type}")
-
-    for record in procedures:
-        check("AP", record.document_type, record.document_number)
-    for record in consultations:
-        check("AC", record.document_type, record.document_number)
-    for record in medications:
-        check("AM", record.document_type, record.document_number)
-    for record in other_services:
-        check("AT", record.document_type, record.document_number)
+    total_other_services = DECIMAL_ZERO
+    for idx, record in enumerate(other_services, start=1):
+        _check_doc("AT", record.document_type, record.document_number, target_doc_type, target_doc_number, mismatches)
+        if record.total_value is not None:
+            total_other_services += record.total_value
+        if not record.principal_diagnosis:
+            missing_dx.append(f"AT[{idx}] sin diagnóstico principal")
 
     if mismatches:
         messages.append(
@@ -93,30 +84,60 @@ def _validate_documents(
             )
         )
 
+    _report_totals(
+        invoice,
+        total_procedures,
+        total_consultations + total_medications + total_other_services,
+        messages,
+    )
+
+    if missing_dx:
+        messages.append(
+            ValidationMessage(
+                "ERROR",
+                "DX001",
+                "Diagnósticos ausentes: " + "; ".join(missing_dx),
+            )
+        )
+
+    if missing_cups:
+        messages.append(
+            ValidationMessage(
+                "ERROR",
+                "CUPS001",
+                f"Procedimientos sin código CUPS en registros: {', '.join(missing_cups)}.",
+            )
+        )
+
+    if not messages:
+        messages.append(ValidationMessage("INFO", "VAL000", "Registros validados sin inconsistencias detectadas."))
+
+    return messages
 
-def _validate_totals(
-    invoice: RipsInvoiceRecord,
-    procedures: Iterable[RipsProcedureRecord],
-    consultations: Iterable[RipsConsultationRecord],
-    medications: Iterable[RipsMedicationRecord],
-    other_services: Iterable[RipsOtherServiceRecord],
-    messages: List[ValidationMessage],
-) -> None:
-    def safe_sum(values: Iterable[Decimal]) -> Decimal:
-        total = DECIMAL_ZERO
-        for value in values:
-            if value is None:
-                continue
-            total += value
-        return total
 
-    total_procedures = safe_sum(record.net_value for record in procedures)
-    total_consultations = safe_sum(record.net_value for record in consultations)
-    total_medications = safe_sum(record.total_value for record in medications)
-    total_other_services = safe_sum(record.total_value for record in other_services)
+def _check_doc(
+    record_type: str,
+    doc_type: Optional[str],
+    doc_number: Optional[str],
+    target_doc_type: Optional[str],
+    target_doc_number: Optional[str],
+    mismatches: List[str],
+) -> None:
+    if not doc_number:
+        mismatches.append(f"{record_type}: documento vacío")
+        return
+    if target_doc_number and doc_number != target_doc_number:
+        mismatches.append(f"{record_type}: documento {doc_number} != {target_doc_number}")
+    if target_doc_type and doc_type and doc_type != target_doc_type:
+        mismatches.append(f"{record_type}: tipo {doc_type} != {target_doc_type}")
 
-    extras_total = total_consultations + total_medications + total_other_services
 
+def _report_totals(
+    invoice: RipsInvoiceRecord,
+    total_procedures: Decimal,
+    extras_total: Decimal,
+    messages: List[ValidationMessage],
+) -> None:
     if total_procedures > DECIMAL_ZERO:
         calculated_total = total_procedures
         if extras_total > DECIMAL_ZERO:
@@ -139,47 +160,3 @@ def _validate_totals(
                 f"Total factura ({invoice.total_value}) difiere de suma registros ({calculated_total}) por {difference}.",
             )
         )
-
-
-def _validate_diagnoses(
-    procedures: Iterable[RipsProcedureRecord],
-    consultations: Iterable[RipsConsultationRecord],
-    medications: Iterable[RipsMedicationRecord],
-    other_services: Iterable[RipsOtherServiceRecord],
-    messages: List[ValidationMessage],
-) -> None:
-    missing: List[str] = []
-
-    for idx, record in enumerate(procedures, start=1):
-        if not record.diagnosis_code:
-            missing.append(f"AP[{idx}] sin diagnóstico principal")
-    for idx, record in enumerate(consultations, start=1):
-        if not record.principal_diagnosis:
-            missing.append(f"AC[{idx}] sin diagnóstico principal")
-    for idx, record in enumerate(medications, start=1):
-        if not record.principal_diagnosis:
-            missing.append(f"AM[{idx}] sin diagnóstico principal")
-    for idx, record in enumerate(other_services, start=1):
-        if not record.principal_diagnosis:
-            missing.append(f"AT[{idx}] sin diagnóstico principal")
-
-    if missing:
-        messages.append(
-            ValidationMessage(
-                "ERROR",
-                "DX001",
-                "Diagnósticos ausentes: " + "; ".join(missing),
-            )
-        )
-
-
-def _validate_cups(procedures: Iterable[RipsProcedureRecord], messages: List[ValidationMessage]) -> None:
-    missing = [str(idx) for idx, record in enumerate(procedures, start=1) if not record.cups_code]
-    if missing:
-        messages.append(
-            ValidationMessage(
-                "ERROR",
-                "CUPS001",
-                f"Procedimientos sin código CUPS en registros: {', '.join(missing)}.",
-            )
-        )